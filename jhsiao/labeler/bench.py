@@ -0,0 +1,162 @@
+"""Benchmarks for frame loading.
+
+python -m jhsiao.labeler.bench read FILE [FILE...]
+    compare decoding files from read() bytes vs mmap.
+python -m jhsiao.labeler.bench show FILE [FILE...]
+    main thread time to show decoded frames, with and without
+    preparing them on the worker thread.
+python -m jhsiao.labeler.bench resample
+    time to render a tile at zoom scales from different image sizes
+    with PIL's default resize, cv2 INTER_LINEAR, resample() and
+    resample() from the pyramid level BgIm would use.
+"""
+from __future__ import print_function, division
+import sys
+import time
+if sys.version_info.major > 2:
+    import tkinter as tk
+else:
+    import Tkinter as tk
+
+import cv2
+import numpy as np
+
+from PIL import Image, ImageTk
+
+from .bgim import BgIm
+from .imset import decode, decodefile
+from .resample import resample
+
+def _readdecode(fname, reduce=1):
+    with open(fname, 'rb') as f:
+        return decode(f.read(), reduce)
+
+def timeit(func, args, repeat):
+    """Return best seconds per call to func(arg) over args."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.time()
+        for arg in args:
+            func(arg)
+        best = min(best, (time.time() - start) / len(args))
+    return best
+
+def bench_read(fnames, repeat=5):
+    """Compare read() and mmap decoding of fnames."""
+    nbytes = 0
+    for fname in fnames:
+        with open(fname, 'rb') as f:
+            f.seek(0, 2)
+            nbytes += f.tell()
+    nbytes /= len(fnames)
+    for name, func in (('read', _readdecode), ('mmap', decodefile)):
+        secs = timeit(func, fnames, repeat)
+        print('{:>6}: {:8.3f} ms/frame {:8.1f} MB/s'.format(
+            name, secs*1000, nbytes / secs / 2**20))
+
+def _tiles(im, width, height, master):
+    """Make tile photos of im covering width x height like BgIm."""
+    tile = BgIm.TILE
+    h, w = im.shape[:2]
+    for y in range(0, min(height, h), tile):
+        for x in range(0, min(width, w), tile):
+            crop = Image.fromarray(im[y:y+tile, x:x+tile])
+            if master is not None:
+                ImageTk.PhotoImage(crop, master=master)
+
+def bench_show(fnames, width=1280, height=960, repeat=5):
+    """Compare main thread time per frame to show fnames.
+
+    before: main thread converts the frame and renders tiles.
+    after: worker converts (BgIm.prepare), main thread renders tiles.
+    PhotoImage creation is skipped if there is no display.
+    """
+    try:
+        master = tk.Tk()
+        master.withdraw()
+    except tk.TclError:
+        master = None
+        print('no display, timing without PhotoImage')
+    frames = [decodefile(fname) for fname in fnames]
+    prepared = [BgIm.prepare(frame) for frame in frames]
+    def before(frame):
+        _tiles(BgIm.prepare(frame), width, height, master)
+    def after(im):
+        _tiles(im, width, height, master)
+    for name, func, args in (
+            ('before', before, frames),
+            ('after', after, prepared),
+            ('worker', BgIm.prepare, frames)):
+        secs = timeit(func, args, repeat)
+        print('{:>6}: {:8.3f} ms/frame'.format(name, secs*1000))
+    if master is not None:
+        master.destroy()
+
+SIZES = ((640, 480), (1920, 1080), (4000, 3000), (12000, 9000))
+SCALES = (0.125, 0.3, 0.5, 0.75, 1.5, 2, 3, 4)
+
+def bench_resample(sizes=SIZES, scales=SCALES, repeat=5):
+    """Time rendering a central TILE x TILE tile at scales.
+
+    The pyramid column excludes building the level, which BgIm does
+    once per frame and zoom level.
+    """
+    tile = BgIm.TILE
+    print('{:>12} {:>6} {:>8} {:>8} {:>8} {:>8}  ms/tile'.format(
+        'size', 'scale', 'pil', 'linear', 'resample', 'pyramid'))
+    for w, h in sizes:
+        src = np.random.randint(0, 256, (h, w, 3), np.uint8)
+        pil = Image.fromarray(src)
+        for scale in scales:
+            tw = min(tile, int(w*scale))
+            th = min(tile, int(h*scale))
+            x = (int(w*scale) - tw) // 2
+            y = (int(h*scale) - th) // 2
+            box = (x/scale, y/scale, (x+tw)/scale, (y+th)/scale)
+            def usepil(_):
+                pil.resize((tw, th), box=box)
+            def uselinear(_):
+                sub = src[
+                    int(box[1]):int(np.ceil(box[3])),
+                    int(box[0]):int(np.ceil(box[2]))]
+                cv2.resize(sub, (tw, th), interpolation=cv2.INTER_LINEAR)
+            def useresample(_):
+                np.ascontiguousarray(resample(src, x, y, tw, th, scale))
+            level, rel = src, scale
+            while rel <= 0.5:
+                level = cv2.resize(
+                    level, (level.shape[1]//2, level.shape[0]//2),
+                    interpolation=cv2.INTER_AREA)
+                rel *= 2
+            def usepyramid(_):
+                np.ascontiguousarray(resample(level, x, y, tw, th, rel))
+            times = [
+                timeit(func, [None], repeat)*1000
+                for func in (usepil, uselinear, useresample, usepyramid)]
+            print('{:>12} {:>6} {:8.3f} {:8.3f} {:8.3f} {:8.3f}'.format(
+                '{}x{}'.format(w, h), scale, *times))
+
+if __name__ == '__main__':
+    import argparse
+    p = argparse.ArgumentParser()
+    sub = p.add_subparsers(dest='command')
+    sp = sub.add_parser('read', help='compare read() vs mmap decoding')
+    sp.add_argument('fnames', nargs='+', help='image files')
+    sp.add_argument('-r', '--repeat', type=int, default=5)
+    sp = sub.add_parser('show', help='main thread time to show frames')
+    sp.add_argument('fnames', nargs='+', help='image files')
+    sp.add_argument('-r', '--repeat', type=int, default=5)
+    sp.add_argument(
+        '-s', '--size', type=int, nargs=2, default=(1280, 960),
+        help='canvas width and height')
+    sp = sub.add_parser('resample', help='compare tile resampling')
+    sp.add_argument('-r', '--repeat', type=int, default=5)
+    args = p.parse_args()
+    if args.command == 'read':
+        bench_read(args.fnames, args.repeat)
+    elif args.command == 'show':
+        bench_show(args.fnames, args.size[0], args.size[1], args.repeat)
+    elif args.command == 'resample':
+        bench_resample(repeat=args.repeat)
+    else:
+        p.print_help()
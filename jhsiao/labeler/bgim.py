@@ -1,3 +1,4 @@
+from __future__ import division
 import sys
 if sys.version_info.major > 2:
     import tkinter as tk
@@ -5,6 +6,7 @@ if sys.version_info.major > 2:
 else:
     import Tkinter as tk
     import tkMessageBox as messagebox
+from collections import OrderedDict
 
 from PIL import Image, ImageTk
 import cv2
@@ -12,56 +14,265 @@ import numpy as np
 
 from .. import tkutil as tku
 from .crosshairs import Crosshairs
+from .resample import resample
+from .window import Window
 
 class BgIm(object):
+    """Background image drawn as tiles.
+
+    Only TILE x TILE tiles that intersect the view are rendered, so
+    memory and time depend on the window size rather than the image
+    size times the zoom.  Tile items are reused as the view changes.
+    Call schedule() when the view changes (scrolling, resizing).
+
+    Zooming out resamples from the nearest larger level of a lazily
+    built pyramid of halvings.  Rendered tiles are cached (LRU, up to
+    CACHEBYTES) per frame so returning to a zoom level is cheap.
+    Tiles are resampled with resample.resample.
+
+    uint16 and float frames are kept at full depth and only visible
+    tiles are mapped to uint8 through window, so changing the window
+    only re-renders the view.
+    """
+    TAG = 'BgIm'
+    TILE = 512
+    MAXSCALE = 32
+    CACHEBYTES = 128 * 2**20
     def __init__(self, widget):
         """Initialize background image."""
-        tag = 'BgIm'
-        self.idn = widget.create_image(0,0, anchor='nw')
-        self.im = None
         self.raw = None
-        widget.addtag(tag, 'withtag', self.idn)
-        if not widget.bind_class(tag):
+        # raw is 1/reduce of the full resolution image.
+        self.reduce = 1
+        # current display scale relative to full resolution
+        self.scale = 1
+        # displayed (width, height)
+        self.size = (0, 0)
+        # (col, row): [item id, PhotoImage]
+        self.tiles = {}
+        self.free = []
+        self.pending = None
+        # raw and successive halvings of it
+        self.pyramid = []
+        # (mult, col, row): PhotoImage
+        self.cache = OrderedDict()
+        self.cached = 0
+        self.window = Window()
+        if not widget.bind_class(self.TAG):
             tku.add_bindings(
-                widget, tag, bindfunc='tag_bind',
+                widget, self.TAG, bindfunc='tag_bind',
                 tupit=tku.memberit(self))
         self.show(widget, None)
 
     def zoom(self, widget, scale):
-        """Zoom image to a scale relative to raw image.
+        """Zoom image to a scale relative to full resolution image.
 
         Return if True or not. (If too small, fail because imdim is 0.)
+        Tiles are rendered when idle, after the caller adjusts the view.
         """
-        if scale > 5:
+        if scale > self.MAXSCALE:
             return False
-        newsize = (
-            int(self.raw.width*scale), int(self.raw.height*scale))
-        if not all(newsize):
+        mult = scale * self.reduce
+        h, w = self.raw.shape[:2]
+        if not (int(w*mult) and int(h*mult)):
             return False
-        resized = self.raw.resize(newsize)
-        self.im = ImageTk.PhotoImage(resized)
-        widget.itemconfigure(self.idn, image=self.im)
-        widget.configure(scrollregion=widget.bbox(self.idn))
+        self.scale = scale
+        self._layout(widget)
+        self.schedule(widget)
         return True
 
-    def show(self, widget, im):
-        """Show an image.
+    def swap(self, widget, im, prepared=False):
+        """Replace a reduced image with full resolution im.
 
-        im: a filepath(str), blank image(None), ndarray (bgr)
-            or a PIL image
+        The current scale is kept.  im is as for show().
+        """
+        if not prepared:
+            im = self.prepare(im)
+        self._setraw(im, 1)
+        self._layout(widget)
+        self.render(widget)
+
+    @staticmethod
+    def prepare(im):
+        """Convert im for show() to a gray or rgb ndarray.
+
+        uint16 and float32 are kept for gray images.  This is the bulk
+        of the cost of showing a large frame and does not touch tk, so
+        call it off the main thread where possible.
         """
         if isinstance(im, str):
             im = Image.open(im)
-        elif im is None:
-            im = Image.fromarray(np.full((480,640), 255, np.uint8))
-        elif isinstance(im, np.ndarray):
+        if im is None:
+            im = np.full((480,640), 255, np.uint8)
+        elif isinstance(im, Image.Image):
+            if im.mode not in ('L', 'RGB', 'I;16', 'F'):
+                im = im.convert('RGB')
+            im = np.asarray(im)
+        else:
+            if im.dtype != np.uint8:
+                if im.ndim == 3:
+                    if im.dtype == np.uint16:
+                        im = (im >> 8).astype(np.uint8)
+                    else:
+                        im = cv2.normalize(
+                            im, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+                elif im.dtype != np.uint16:
+                    im = im.astype(np.float32)
             if im.ndim == 3:
-               im = im[...,2::-1]
-            im = Image.fromarray(im)
-        self.raw = im
-        self.im = ImageTk.PhotoImage(im)
-        widget.itemconfigure(self.idn, image=self.im)
-        widget.configure(scrollregion=widget.bbox(self.idn))
+                if im.shape[2] == 4:
+                    im = cv2.cvtColor(im, cv2.COLOR_BGRA2RGB)
+                elif im.shape[2] == 3:
+                    im = cv2.cvtColor(im, cv2.COLOR_BGR2RGB)
+                else:
+                    im = im[..., 0]
+        return im
+
+    def show(self, widget, im, reduce=1, prepared=False):
+        """Show an image.
+
+        im: a filepath(str), blank image(None), ndarray (bgr)
+            or a PIL image
+        reduce: im is 1/reduce of the full resolution.  It is shown as
+            is, so the scale is 1/reduce.
+        prepared: im is already the result of prepare().
+        """
+        if not prepared:
+            im = self.prepare(im)
+        self._setraw(im, reduce)
+        self.scale = 1 / reduce
+        self._layout(widget)
+        self.render(widget)
+
+    def _setraw(self, raw, reduce):
+        """Change the image, dropping its pyramid and tile cache."""
+        self.raw = raw
+        self.reduce = reduce
+        self.pyramid = [raw]
+        self.cache.clear()
+        self.cached = 0
+        if self.highbit():
+            self.window.fit(raw)
+
+    def highbit(self):
+        """Return whether the image needs windowing."""
+        return self.raw.dtype != np.uint8
+
+    def rewindow(self, widget, mode, lo=None, hi=None):
+        """Change the window and re-render if the image is high bit.
+
+        mode: one of Window.MODES, lo and hi are used for 'manual'.
+        """
+        self.window.set(mode, lo, hi)
+        if self.highbit():
+            if mode != 'manual':
+                self.window.fit(self.raw)
+            self.free.extend(self.tiles.values())
+            self.tiles = {}
+            self.render(widget)
+
+    def _layout(self, widget):
+        """Update size and scrollregion, mark all tiles stale.
+
+        Stale tiles keep their images until reused by render() so the
+        old view stays up until then.
+        """
+        mult = self.scale * self.reduce
+        h, w = self.raw.shape[:2]
+        self.size = (max(int(w*mult), 1), max(int(h*mult), 1))
+        widget.configure(scrollregion=(0, 0) + self.size)
+        self.free.extend(self.tiles.values())
+        self.tiles = {}
+
+    def schedule(self, widget):
+        """Render visible tiles when idle."""
+        if self.pending is None:
+            self.pending = widget.after_idle(self.render, widget)
+
+    def render(self, widget):
+        """Render tiles intersecting the view, hide the others."""
+        if self.pending is not None:
+            widget.after_cancel(self.pending)
+            self.pending = None
+        tile = self.TILE
+        w, h = self.size
+        left = max(int(widget.canvasx(0)) // tile, 0)
+        top = max(int(widget.canvasy(0)) // tile, 0)
+        right = min(
+            int(widget.canvasx(widget.winfo_width())) // tile + 1,
+            -(-w // tile))
+        bottom = min(
+            int(widget.canvasy(widget.winfo_height())) // tile + 1,
+            -(-h // tile))
+        tiles = self.tiles
+        for key in list(tiles):
+            col, row = key
+            if not (left <= col < right and top <= row < bottom):
+                self.free.append(tiles.pop(key))
+        for row in range(top, bottom):
+            for col in range(left, right):
+                if (col, row) in tiles:
+                    continue
+                if self.free:
+                    info = self.free.pop()
+                    widget.coords(info[0], col*tile, row*tile)
+                else:
+                    info = [widget.create_image(
+                        col*tile, row*tile, anchor='nw', tags=(self.TAG,)),
+                        None]
+                    widget.tag_lower(info[0])
+                info[1] = self._photo(col, row)
+                widget.itemconfigure(info[0], image=info[1])
+                tiles[col, row] = info
+        for info in self.free:
+            if info[1] is not None:
+                widget.itemconfigure(info[0], image='')
+                info[1] = None
+
+    def _photo(self, col, row):
+        """Return PhotoImage of tile col, row from cache or render it."""
+        key = (self.scale * self.reduce, col, row)
+        if self.highbit():
+            key += self.window.bounds
+        cache = self.cache
+        photo = cache.pop(key, None)
+        if photo is None:
+            photo = ImageTk.PhotoImage(self._tile(col, row))
+            self.cached += photo.width() * photo.height() * 4
+            while cache and self.cached > self.CACHEBYTES:
+                old = cache.popitem(last=False)[1]
+                self.cached -= old.width() * old.height() * 4
+        cache[key] = photo
+        return photo
+
+    def _level(self, mult):
+        """Return (pyramid level, scale relative to it) for mult.
+
+        This is the smallest level that is not smaller than mult of
+        raw.  Levels are built as needed with INTER_AREA halving.
+        """
+        pyramid = self.pyramid
+        level = 0
+        while mult <= 0.5:
+            prev = pyramid[level]
+            if min(prev.shape[:2]) < 2:
+                break
+            if len(pyramid) == level + 1:
+                pyramid.append(cv2.resize(
+                    prev, (prev.shape[1] // 2, prev.shape[0] // 2),
+                    interpolation=cv2.INTER_AREA))
+            mult *= 2
+            level += 1
+        return pyramid[level], mult
+
+    def _tile(self, col, row):
+        """Return PIL image of tile col, row at the current scale."""
+        tile = self.TILE
+        w, h = self.size
+        x, y = col*tile, row*tile
+        src, mult = self._level(self.scale * self.reduce)
+        im = resample(src, x, y, min(tile, w-x), min(tile, h-y), mult)
+        if self.highbit():
+            im = self.window.apply(im)
+        return Image.fromarray(im)
 
     @tku.Bindings('<Button-1>')
     @staticmethod
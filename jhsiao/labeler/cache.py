@@ -0,0 +1,106 @@
+"""Caching of decoded frames.
+
+Frames are keyed by (imageset path, frame name) so reopening an image
+set (ImageSet.next) can reuse frames that were already decoded.
+"""
+from __future__ import division
+__all__ = ['FrameCache']
+from collections import OrderedDict
+import threading
+
+class FrameCache(object):
+    """Thread-safe LRU cache of (name, frame) with a byte budget.
+
+    Cost of an entry is the nbytes of its frame.  Frames that failed to
+    decode (None) are not cached so they will be retried.  A frame
+    larger than the whole budget is never cached.
+    """
+    def __init__(self, budget=512*1024*1024):
+        """Initialize cache.
+
+        budget: maximum total nbytes of cached frames.
+        """
+        self.lock = threading.Lock()
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.items = OrderedDict()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        """Check for key without affecting LRU order or counters."""
+        with self.lock:
+            return key in self.items
+
+    def get(self, key):
+        """Return cached (name, frame) or None."""
+        with self.lock:
+            try:
+                item = self.items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.items[key] = item
+            self.hits += 1
+            return item
+
+    def put(self, key, item):
+        """Add item: (name, frame) to the cache.
+
+        Return whether the item was cached.
+        """
+        frame = item[1]
+        if frame is None:
+            return False
+        cost = frame.nbytes
+        with self.lock:
+            if cost > self.budget:
+                return False
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.size -= old[1].nbytes
+            self.items[key] = item
+            self.size += cost
+            self._shrink(self.budget)
+        return True
+
+    def _shrink(self, budget):
+        """Evict least recently used items until size <= budget.
+
+        Assume lock is held.
+        """
+        items = self.items
+        while self.size > budget and items:
+            key = next(iter(items))
+            self.size -= items.pop(key)[1].nbytes
+            self.evictions += 1
+
+    def resize(self, budget):
+        """Change the budget, evicting as needed."""
+        with self.lock:
+            self.budget = budget
+            self._shrink(budget)
+
+    def discard(self, owner):
+        """Remove all frames belonging to owner (an imageset path)."""
+        with self.lock:
+            for key in [k for k in self.items if k[0] == owner]:
+                self.size -= self.items.pop(key)[1].nbytes
+
+    def clear(self):
+        """Remove everything."""
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+    def stats(self):
+        """Return a dict of counters for tuning the budget."""
+        with self.lock:
+            return dict(
+                hits=self.hits, misses=self.misses,
+                evictions=self.evictions, count=len(self.items),
+                size=self.size, budget=self.budget)
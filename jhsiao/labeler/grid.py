@@ -0,0 +1,326 @@
+"""Grid of thumbnails for browsing and triaging an image set."""
+from __future__ import division
+__all__ = ['GridView']
+import sys
+if sys.version_info.major > 2:
+    import tkinter as tk
+    import queue
+else:
+    import Tkinter as tk
+    import Queue as queue
+
+import cv2
+from PIL import Image, ImageTk
+
+from .. import tkutil as tku
+from ..labeleritems import Item
+from .thumbs import ThumbStore
+
+class GridCanv(tk.Canvas, object):
+    """Canvas of thumbnails that only has items for visible cells.
+
+    The canvas itself does not scroll.  top is the y offset in pixels
+    of the view into the full grid and cells are placed relative to
+    it.  Cells leaving the view are deleted and their image items are
+    reused for cells entering it, so the number of canvas items stays
+    proportional to the window size regardless of the set size.
+    Existing labels are drawn over thumbnails as outlines.
+    """
+    PAD = 4
+    def __init__(self, master, *args, **kwargs):
+        kwargs.setdefault('borderwidth', 0)
+        kwargs.setdefault('highlightthickness', 0)
+        kwargs.setdefault('background', 'gray20')
+        super(GridCanv, self).__init__(master, *args, **kwargs)
+        self.store = None
+        self.labels = {}
+        self.cell = 1
+        self.top = 0
+        self.total = 0
+        # idx: [image id, name, PhotoImage, (x, y), requested]
+        self.cells = {}
+        self.free = []
+        self.current = None
+        self.onclick = None
+        self.onscroll = None
+        self.pending = None
+        self.highlight = self.create_rectangle(
+            0, 0, 0, 0, outline='yellow', width=2, state='hidden')
+        self._thumbq = queue.Queue()
+        self._thumbname = str(id(self._thumbs.__func__))+'_thumbs'
+        self.tk.createcommand(self._thumbname, self._thumbs)
+        tag = 'GridCanv'
+        tku.subclass(self, tag)
+        if not self.bind_class(tag):
+            tku.add_bindings(self, tag)
+
+    def set_store(self, store, labels):
+        """Show thumbnails from store with labels (name: items)."""
+        self.clear()
+        self.store = store
+        self.labels = labels
+        self.cell = store.size + 2*self.PAD
+        self.top = 0
+        self.schedule()
+
+    def clear(self):
+        """Remove all cells."""
+        for idx in list(self.cells):
+            self._drop(idx)
+        if self.store is not None:
+            self.store.cancel()
+
+    def relabel(self, labels, name=None):
+        """Change labels and redraw cells of name (None for all)."""
+        self.labels = labels
+        if name is None:
+            self.clear()
+        else:
+            for idx, cell in list(self.cells.items()):
+                if cell[1] == name:
+                    self._drop(idx)
+        self.schedule()
+
+    def schedule(self):
+        """Refresh when idle (coalescing scroll events)."""
+        if self.pending is None:
+            self.pending = self.after_idle(self.refresh)
+
+    def _xy(self, idx):
+        """Return view coordinates of center of cell idx."""
+        row, col = divmod(idx, self.cols())
+        half = self.cell / 2
+        return col*self.cell + half, row*self.cell - self.top + half
+
+    def cols(self):
+        return max(self.winfo_width() // self.cell, 1)
+
+    def cellat(self, x, y):
+        """Return idx of the cell at view coordinates x, y or None."""
+        col = int(x // self.cell)
+        if col >= self.cols():
+            return None
+        idx = int((y + self.top) // self.cell) * self.cols() + col
+        if 0 <= idx < len(self.store.imset):
+            return idx
+        return None
+
+    def refresh(self):
+        """Create/move items for cells in view."""
+        self.pending = None
+        store = self.store
+        if store is None:
+            return
+        count = len(store.imset)
+        cols = self.cols()
+        height = self.winfo_height()
+        self.total = -(-count // cols) * self.cell
+        self.top = min(max(self.top, 0), max(self.total - height, 0))
+        first = int(self.top // self.cell) * cols
+        last = min(int((self.top + height) // self.cell + 1) * cols, count)
+        dropped = [idx for idx in self.cells if not first <= idx < last]
+        for idx in dropped:
+            self._drop(idx)
+        if dropped:
+            store.cancel()
+            for cell in self.cells.values():
+                if cell[2] is None:
+                    cell[4] = False
+        for idx in range(first, last):
+            cell = self.cells.get(idx)
+            x, y = self._xy(idx)
+            if cell is None:
+                if self.free:
+                    imid = self.free.pop()
+                    self.coords(imid, x, y)
+                else:
+                    imid = self.create_image(x, y, anchor='center')
+                self.addtag('cell_{}'.format(idx), 'withtag', imid)
+                cell = self.cells[idx] = [
+                    imid, store.imset[idx][1], None, (x, y), False]
+            elif cell[3] != (x, y):
+                ox, oy = cell[3]
+                self.move('cell_{}'.format(idx), x-ox, y-oy)
+                cell[3] = (x, y)
+            if not cell[4]:
+                cell[4] = True
+                thumb, scale = store.request(idx, self._thumb_callback)
+                if thumb is not None:
+                    self._setthumb(idx, thumb, scale)
+        self._place_highlight()
+        if self.onscroll is not None:
+            if self.total:
+                self.onscroll(
+                    self.top / self.total,
+                    min((self.top + height) / self.total, 1))
+            else:
+                self.onscroll(0, 1)
+
+    def _drop(self, idx):
+        """Remove cell idx, keeping its image item for reuse."""
+        imid = self.cells.pop(idx)[0]
+        tag = 'cell_{}'.format(idx)
+        self.dtag(imid, tag)
+        self.delete(tag)
+        self.itemconfigure(imid, image='')
+        self.free.append(imid)
+
+    def _thumb_callback(self, idx, name, thumb, scale):
+        self._thumbq.put((idx, name, thumb, scale))
+        self.tk.call('after', 'idle', self._thumbname)
+
+    def _thumbs(self):
+        """Apply delivered thumbnails."""
+        while True:
+            try:
+                idx, name, thumb, scale = self._thumbq.get_nowait()
+            except queue.Empty:
+                return
+            cell = self.cells.get(idx)
+            if cell is not None and cell[1] == name and thumb is not None:
+                self._setthumb(idx, thumb, scale)
+
+    def _setthumb(self, idx, thumb, scale):
+        """Show thumb for cell idx and draw its labels."""
+        cell = self.cells[idx]
+        if thumb.ndim == 2:
+            photo = Image.fromarray(thumb)
+        else:
+            photo = Image.fromarray(cv2.cvtColor(thumb, cv2.COLOR_BGR2RGB))
+        cell[2] = ImageTk.PhotoImage(photo, master=self)
+        self.itemconfigure(cell[0], image=cell[2])
+        x, y = cell[3]
+        h, w = thumb.shape[:2]
+        self.overlay(
+            idx, self.labels.get(cell[1], ()), x - w/2, y - h/2, scale)
+
+    def overlay(self, idx, items, left, top, scale):
+        """Draw outlines of items (todict() dicts) over cell idx."""
+        tag = 'cell_{}'.format(idx)
+        for dct in items:
+            try:
+                color, polygons = Item.outlinedict(dct)
+            except Exception:
+                continue
+            for poly in polygons:
+                coords = [
+                    (left if i % 2 == 0 else top) + v*scale
+                    for i, v in enumerate(poly)]
+                if len(coords) == 2:
+                    x, y = coords
+                    self.create_oval(
+                        x-2, y-2, x+2, y+2, fill=color, outline='',
+                        tags=(tag,))
+                elif len(coords) == 4:
+                    self.create_line(*coords, fill=color, tags=(tag,))
+                else:
+                    self.create_polygon(
+                        *coords, fill='', outline=color, tags=(tag,))
+
+    def setcurrent(self, idx):
+        """Highlight cell idx and scroll it into view."""
+        self.current = idx
+        if self.store is None:
+            return
+        x, y = self._xy(idx)
+        half = self.cell / 2
+        height = self.winfo_height()
+        if y - half < 0:
+            self.top += y - half
+        elif y + half > height:
+            self.top += y + half - height
+        self.schedule()
+
+    def _place_highlight(self):
+        if self.current is None or self.current not in self.cells:
+            self.itemconfigure(self.highlight, state='hidden')
+            return
+        x, y = self._xy(self.current)
+        half = self.cell / 2 - 1
+        self.coords(self.highlight, x-half, y-half, x+half, y+half)
+        self.itemconfigure(self.highlight, state='normal')
+        self.tag_raise(self.highlight)
+
+    def yview(self, *args):
+        """Scroll like tk.Canvas.yview (for use with a Scrollbar)."""
+        if not args:
+            if self.total:
+                return (
+                    self.top / self.total,
+                    (self.top + self.winfo_height()) / self.total)
+            return 0.0, 1.0
+        if args[0] == 'moveto':
+            self.top = float(args[1]) * self.total
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            if args[2] == 'pages':
+                self.top += amount * max(
+                    self.winfo_height() - self.cell, self.cell)
+            else:
+                self.top += amount * self.cell
+        self.schedule()
+
+    @tku.Bindings('<Configure>')
+    def _resized(widget):
+        widget.clear()
+        widget.schedule()
+
+    @tku.Bindings('<MouseWheel>', '<Button-4>', '<Button-5>')
+    def _wheel(widget, button, delta):
+        if delta is None:
+            step = -1 if button == 4 else 1
+        else:
+            step = -1 if delta > 0 else 1
+        widget.yview('scroll', step, 'units')
+
+    @tku.Bindings('<Button-1>')
+    def _clicked(widget, x, y):
+        idx = widget.cellat(x, y)
+        if idx is not None and widget.onclick is not None:
+            widget.onclick(idx)
+
+class GridView(tk.Toplevel, object):
+    """Window with a GridCanv of a Labeler's current image set.
+
+    Clicking a thumbnail shows that frame in the Labeler.
+    """
+    def __init__(self, labeler, size=ThumbStore.SIZE):
+        super(GridView, self).__init__(labeler)
+        self.labeler = labeler
+        self.size = size
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        self.canv = GridCanv(self, width=5*(size+2*GridCanv.PAD), height=600)
+        self.canv.grid(row=0, column=0, sticky='nsew')
+        self.scrollbar = tk.Scrollbar(
+            self, orient='vertical', command=self.canv.yview)
+        self.scrollbar.grid(row=0, column=1, sticky='ns')
+        self.canv.onscroll = self.scrollbar.set
+        self.canv.onclick = self._clicked
+        self.store = None
+        self.protocol('WM_DELETE_WINDOW', self.close)
+        self.set_imset(labeler.imset)
+
+    def set_imset(self, imset):
+        """Show thumbnails of imset."""
+        if self.store is not None:
+            self.canv.clear()
+            self.store.close()
+            self.store = None
+        if imset is None:
+            return
+        self.title('grid: {}'.format(imset.path))
+        self.store = ThumbStore(imset, self.size)
+        self.canv.set_store(self.store, self.labeler.labels)
+        self.canv.setcurrent(imset.index)
+
+    def _clicked(self, idx):
+        self.labeler.show(idx)
+
+    def close(self):
+        if self.store is not None:
+            self.canv.clear()
+            self.store.close()
+            self.store = None
+        self.labeler.gridview = None
+        self.destroy()
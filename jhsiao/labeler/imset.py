@@ -4,26 +4,76 @@ ImDirs should contain only image files, no subdirs
 """
 from __future__ import print_function, division
 __all__ = ['ImageSet', 'image_exts', 'loop']
-from collections import defaultdict
-from itertools import chain
+import atexit
+import bisect
+import bz2
+from collections import OrderedDict, defaultdict, deque
+import gzip
+import heapq
+from itertools import chain, count
 import mimetypes
+import mmap
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import os
 import re
+import struct
 import sys
+import tarfile
 import threading
+import time
 import traceback
+import weakref
 import zipfile
+import zlib
 if sys.version_info.major > 2:
+    import lzma
     import queue
+    from os import scandir
 else:
     import Queue as queue
+    lzma = scandir = None
 
 import cv2
 import numpy as np
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from . import sidecar
+from .cache import FrameCache
 
 # missing mimetypes
 mimetypes.add_type('image/webp', '.webp')
 
+# Video decoding threads must leave cv2 before interpreter shutdown
+# or the process aborts.
+_exiting = threading.Event()
+_daemons = weakref.WeakSet()
+_readers = weakref.WeakSet()
+_loops = weakref.WeakSet()
+
+def _daemon(target, *args):
+    """Start and return a daemon thread that is joined at exit."""
+    thread = threading.Thread(target=target, args=args)
+    thread.daemon = True
+    thread.start()
+    _daemons.add(thread)
+    return thread
+
+@atexit.register
+def _stop_daemons():
+    _exiting.set()
+    for reader in list(_readers):
+        reader.close()
+    for loop in list(_loops):
+        with loop.lock:
+            dropped = loop._stop() if loop.state is not None else None
+        del dropped
+    for thread in list(_daemons):
+        thread.join(1)
+
 def filetypes(tps=[]):
     """Return filetypes tuples suitable for tkinter filedialog."""
     if not tps:
@@ -34,139 +84,400 @@ def filetypes(tps=[]):
         for k, v in sorted(tpdct.items()):
             v[0] = '*'+v[0]
             tps.append((k, ' *'.join(v)))
+        tps.append(
+            ('manifest', ' '.join(['*'+ext for ext in ManifestSet.EXTS])))
         tps.append(('all', '*.*'))
     return tps
 
+_tarexts = (
+    ('.tar', ''), ('.tar.gz', 'gz'), ('.tgz', 'gz'), ('.tar.bz2', 'bz2'),
+    ('.tbz2', 'bz2'), ('.tbz', 'bz2'), ('.tar.xz', 'xz'), ('.txz', 'xz'))
+def tarcompression(name):
+    """Return compression of tar name ('', 'gz', 'bz2', 'xz') or None."""
+    for ext, compression in _tarexts:
+        if name.endswith(ext):
+            return compression
+    return None
+
+def kindof(name, isdir=False):
+    """Return a char for the kind of entry name.
+
+    d: directory, z: zip, t: tar, v: video, i: image, -: other
+    """
+    if isdir:
+        return 'd'
+    if name.endswith('.zip'):
+        return 'z'
+    if tarcompression(name) is not None:
+        return 't'
+    tp, enc = mimetypes.guess_type(name)
+    if tp is not None:
+        basetype = tp.split('/', 1)[0]
+        if basetype == 'video':
+            return 'v'
+        elif basetype == 'image':
+            return 'i'
+    return '-'
+
+def scan(dirname):
+    """Return a dict of {name: kindof(name)} for entries of dirname."""
+    if scandir is None:
+        return dict(
+            (name, kindof(name, os.path.isdir(os.path.join(dirname, name))))
+            for name in os.listdir(dirname))
+    else:
+        return dict(
+            (entry.name, kindof(entry.name, entry.is_dir()))
+            for entry in scandir(dirname))
+
+def listing(dirname):
+    """Return naturally sorted names and their kinds for dirname.
+
+    The result is cached as a 'listing' sidecar manifest which is
+    invalidated when the directory mtime changes.
+    """
+    data = sidecar.load(dirname, 'listing')
+    if data is None:
+        stamp = sidecar.stamp(dirname)
+        entries = scan(dirname)
+        names = sorted(entries, key=ImageSet._numsort_key)
+        kinds = ''.join([entries[name] for name in names])
+        sidecar.save(
+            dirname, 'listing', dict(names=names, kinds=kinds), stamp)
+        return names, kinds
+    return data['names'], data['kinds']
+
+_magics = (
+    b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a', b'BM',
+    b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+',
+    b'\x00\x00\x00\x0cjP  ', b'\xffO\xffQ', b'v/1\x01', b'#?RADIANCE',
+    b'#?RGBE', b'P1', b'P2', b'P3', b'P4', b'P5', b'P6', b'P7', b'PF', b'Pf')
+def sniff(fname):
+    """Return whether fname starts with a known image signature."""
+    try:
+        with open(fname, 'rb') as f:
+            head = f.read(16)
+    except EnvironmentError:
+        return False
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return True
+    return head.startswith(_magics)
+
+_imreadflags = {
+    1: cv2.IMREAD_UNCHANGED,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+def decode(buf, reduce=1, offset=0, count=-1):
+    """Decode an encoded image buffer.
+
+    reduce: 1 to decode as is, else decode bgr at 1/reduce size
+        (2, 4, or 8).  This is much faster for jpegs.
+    offset, count: byte range of buf to decode, default all of it.
+    """
+    return cv2.imdecode(
+        np.frombuffer(buf, np.uint8, count, offset), _imreadflags[reduce])
+
+def decodefile(fname, reduce=1):
+    """Decode an image file.
+
+    The file is mmapped instead of read so the only allocation is the
+    decoded image.  Return None for empty files.
+    """
+    with open(fname, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+    try:
+        return decode(mm, reduce)
+    finally:
+        mm.close()
+
+class NameIndex(object):
+    """Index of path-like names for findfkey lookups.
+
+    exact and basename matches are dict lookups.  startswith basename
+    matches bisect a sorted list of basenames.
+    """
+    def __init__(self, names):
+        self.names = names
+        self.exact = {}
+        self.bases = {}
+        for idx, name in enumerate(names):
+            self.exact.setdefault(name, idx)
+            self.bases.setdefault(os.path.basename(name), idx)
+        prefixes = sorted(
+            (base, idx) for idx, base in
+            enumerate(map(os.path.basename, names)))
+        self.prefixes = [base for base, idx in prefixes]
+        self.prefixidxs = [idx for base, idx in prefixes]
+
+    def find(self, target, pick=None):
+        """Return index of target.
+
+        Priority is:
+            exact match
+            exact basename match
+            startswith basename match
+        pick: If multiple startswith matches, then select the pickth
+            candidate (in order of names).
+        """
+        idx = self.exact.get(target)
+        if idx is not None:
+            return idx
+        tbase = os.path.basename(target)
+        idx = self.bases.get(tbase)
+        if idx is not None:
+            return idx
+        prefixes = self.prefixes
+        candidates = []
+        for i in range(bisect.bisect_left(prefixes, tbase), len(prefixes)):
+            if not prefixes[i].startswith(tbase):
+                break
+            candidates.append(self.prefixidxs[i])
+        if candidates:
+            candidates.sort()
+            if len(candidates) == 1:
+                return candidates[0]
+            elif pick is not None:
+                return candidates[pick]
+            else:
+                raise KeyError(
+                    'ambiguous key {}: {}'.format(
+                        repr(target),
+                        list(map(self.names.__getitem__, candidates))))
+        else:
+            raise KeyError('bad key {}'.format(target))
 
 def findfkey(target, items, key=None, pick=None):
     """Find key.
 
-    Keys are expected to be path-like.
-    Priority is:
-        exact match
-        exact basename match
-        startswith basename match
-    attr: getattr on the items if given.
+    Keys are expected to be path-like.  See NameIndex.find.
+    key: applied to items to get names if given.
     pick: If multiple matches, then select the pickth
         candidate.
     """
-    if key is None:
-        try:
-            return items.index(target)
-        except ValueError:
-            pass
-    else:
-        for idx, item in enumerate(map(key, items)):
-            if item == target:
-                return idx
-        else:
-            items = list(map(key, items))
-    tbase = os.path.basename(target)
-    candidates = []
-    for i, base in map(os.path.basename, items):
-        if base == tbase:
-            return i
-        elif base.startswith(tbase):
-            candidates.append(i)
-    if candidates:
-        if len(candidates) == 1:
-            return candidates[0]
-        elif pick is not None:
-            return candidates[pick]
-        else:
-            raise KeyError(
-                'ambiguous key {}: {}'.format(
-                    repr(target),
-                    list(map(items.__getitem__, candidates))))
-    else:
-        raise KeyError('bad key {}'.format(target))
+    if key is not None:
+        items = list(map(key, items))
+    return NameIndex(items).find(target, pick)
+
+class Job(object):
+    """A function call queued on a Loop."""
+    def __init__(self, func, arg, priority, owner):
+        self.func = func
+        self.arg = arg
+        self.priority = priority
+        self.owner = owner
+        self.cancelled = False
+
+    def cancel(self):
+        """Cancel the job.
+
+        A pending job will be skipped.  A running job will finish but
+        LoopProxy.deliver() will not call its callback.
+        """
+        self.cancelled = True
 
 class Loop(object):
-    """Threaded loop to call functions asynchronously."""
+    """Pool of threads to call functions asynchronously.
+
+    Jobs are run in order of priority (lower first) and then in order
+    of submission.  Each LoopProxy has at most one live VISIBLE job:
+    putting a new one cancels the previous one (latest wins) as well as
+    any pending PREFETCH jobs from the same proxy because those were
+    relative to the old position.  THUMBNAIL jobs are only cancelled
+    explicitly.
+    """
+    VISIBLE, PREFETCH, THUMBNAIL = range(3)
+
     class LoopProxy(object):
         def __init__(self, loop):
             self.loop = loop
             self.lock = loop.lock
+            self.dlock = threading.Lock()
+            self.jobs = set()
+            self.visible = None
             with loop.lock:
                 loop.users += 1
 
-        def put(self, func, arg):
+        def put(self, func, arg, priority=0):
+            """Queue func(arg) and return the Job."""
             loop = self.loop
+            job = Job(func, arg, priority, self)
             with loop.lock:
-                if loop.thread is None:
+                if loop.state is None:
                     loop._start()
-                loop.item[0] = (func, arg)
-                loop.has.set()
+                if priority == Loop.VISIBLE:
+                    if self.visible is not None:
+                        self.visible.cancel()
+                    self.visible = job
+                    self._cancel(Loop.PREFETCH)
+                self.jobs.add(job)
+                loop._push(job)
+            return job
+
+        def cancel(self, priority=None):
+            """Cancel pending jobs of priority (all if None)."""
+            with self.lock:
+                self._cancel(priority)
+
+        def _cancel(self, priority):
+            """Cancel pending jobs, assume lock is held."""
+            for job in self.jobs:
+                if priority is None or job.priority == priority:
+                    job.cancel()
+
+        def stale(self):
+            """Return whether the job running on this thread is cancelled."""
+            job = getattr(self.loop.local, 'job', None)
+            return job is not None and job.cancelled
+
+        def deliver(self, func, *args):
+            """Call func(*args) unless the running job was cancelled.
+
+            Deliveries are serialized so an older VISIBLE job can never
+            deliver after a newer one.
+            """
+            with self.dlock:
+                if not self.stale():
+                    func(*args)
 
         def release(self):
             loop = self.loop
             if loop is None:
                 return
+            dropped = None
             with loop.lock:
+                self._cancel(None)
                 loop.users -= 1
-                if loop.users == 0 and loop.thread is not None:
-                    loop._stop()
+                if loop.users == 0 and loop.state is not None:
+                    dropped = loop._stop()
             self.loop = None
+            # Dropped jobs may hold the last references to other
+            # proxies whose __del__ needs the lock.
+            del dropped
 
         def __del__(self):
             self.release()
 
-    def __init__(self):
+    class State(object):
+        """Per-start state shared with the worker threads."""
+        def __init__(self, lock):
+            self.heap = []
+            self.cond = threading.Condition(lock)
+            self.stopped = False
+
+    def __init__(self, nworkers=None):
+        """Initialize loop.
+
+        nworkers: number of threads, default to min(4, cpu count).
+            cv2 releases the GIL while decoding, so multiple workers
+            allow decoding several frames concurrently.
+        """
+        if nworkers is None:
+            try:
+                nworkers = min(4, multiprocessing.cpu_count())
+            except NotImplementedError:
+                nworkers = 1
+        self.nworkers = nworkers
         self.lock = threading.Lock()
-        self.item = None
-        self.has = None
+        self.local = threading.local()
+        self.order = count()
+        self.state = None
         self.users = 0
-        self.thread = None
+        _loops.add(self)
 
     def __call__(self):
         """Return a proxy/reference for auto-thread management."""
         return self.LoopProxy(self)
 
+    def _push(self, job):
+        """Add job to queue.  Assume lock is held and started."""
+        state = self.state
+        heapq.heappush(state.heap, (job.priority, next(self.order), job))
+        state.cond.notify()
+
     def _start(self):
-        """Start thread.  Assume not started."""
-        self.item = [None]
-        self.has = threading.Event()
-        self.thread = threading.Thread(
-            target=self._async_loop, args=[self.lock, self.has, self.item])
-        self.thread.daemon = True
-        self.thread.start()
+        """Start threads.  Assume not started."""
+        self.state = state = self.State(self.lock)
+        for _ in range(self.nworkers):
+            _daemon(self._async_loop, self.lock, state, self.local)
 
     def _stop(self):
-        """Stop thread.  Assume started."""
-        self.item[0] = self.item = None
-        self.has.set()
-        self.has = None
-        self.thread = None
+        """Stop threads.  Assume started.
+
+        Return the pending heap entries.  The caller should drop them
+        after releasing the lock.
+        """
+        state = self.state
+        state.stopped = True
+        dropped = state.heap[:]
+        del state.heap[:]
+        state.cond.notify_all()
+        self.state = None
+        return dropped
 
     @staticmethod
-    def _async_loop(lock, has, item):
+    def _async_loop(lock, state, local):
         """Async loop for image loading.
 
-        q: a queue, should take a pair:
-            callable and an arg.
+        Pop the highest priority job and run it.
         """
+        heap = state.heap
         while 1:
-            has.wait()
             with lock:
-                thing = item[0]
-                if thing is None:
+                while not heap and not state.stopped:
+                    state.cond.wait()
+                if state.stopped:
                     sys.stdout.flush()
                     return
-                func, arg = thing
-                thing = item[0] = None
-                has.clear()
+                job = heapq.heappop(heap)[-1]
+                owner = job.owner
+                owner.jobs.discard(job)
+                job.owner = None
+                cancelled = job.cancelled
+            # Drop references outside the lock: the job or its owner
+            # may hold the last reference to a LoopProxy whose __del__
+            # takes the lock.
+            owner = None
+            if cancelled:
+                job.func = job.arg = None
+                job = None
+                continue
+            local.job = job
             try:
-                func(arg)
+                job.func(job.arg)
             except Exception:
                 traceback.print_exc()
             # If func is a bound method of something
             # with reference to a LoopProxy,
             # reassignment may cause __del__ to be fired
             # resulting in a deadlock, so clear the refs.
-            func = arg = None
+            job.func = job.arg = None
+            job = local.job = None
 
 class ImageSet(object):
+    """Base class for a sequence of frames.
+
+    Decoded frames are shared across all ImageSets via CACHE.  Each
+    async retrieval also queues up to PREFETCH frames ahead in the
+    direction of the last nonzero offset (the step) as PREFETCH jobs.
+    Subclasses whose _getframe cannot be called from multiple threads
+    at once should set THREADSAFE to False.  Subclasses whose
+    _getframe supports reduced decoding (reduce argument) should set
+    PREVIEW to True.
+
+    validate() decodes every frame with a process pool to find bad
+    frames.  Stepping (nonzero offset) skips over known bad frames and
+    records their names in skipped.
+    """
     LOOP = Loop()
+    CACHE = FrameCache()
+    PREFETCH = 2
+    THREADSAFE = True
+    PREVIEW = True
     def __init__(self, name):
         self.path = os.path.normpath(name)
         self.dir, self.name = os.path.split(self.path)
@@ -177,9 +488,17 @@ class ImageSet(object):
         for n in os.listdir(self.dir):
             if os.path.normcase(n) == normed:
                 self.name = n
-                self.path = os.path.join(self.dir, self.path)
+                self.path = os.path.join(self.dir, self.name)
         self.loop = ImageSet.LOOP()
+        self.readlock = threading.Lock()
         self.index = 0
+        self.step = 1
+        self.fps = None
+        self.nameindex = None
+        # bool array of bad frames if validated
+        self.badframes = None
+        self.skipped = []
+        self.validator = None
 
     @staticmethod
     def _numsort_key(
@@ -188,6 +507,8 @@ class ImageSet(object):
 
         Suitable for use as a key for numeric sorting.
         Prefer case insensitive sort first.
+        Parts are tagged (0, int) or (1, str) so numbers and text are
+        comparable (numbers first).
         """
         ret1 = []
         ret2 = []
@@ -196,25 +517,39 @@ class ImageSet(object):
             start, stop = match.span()
             nstr = match.group('num')
             if nstr:
-                v = int(nstr)
+                v = (0, int(nstr))
                 ret1.append(v)
                 ret2.append(v)
             else:
-                ret1.append(match.group('alpha').lower())
-                ret2.append(match.group('alpha'))
+                ret1.append((1, match.group('alpha').lower()))
+                ret2.append((1, match.group('alpha')))
             match = pattern.search(string, stop)
         ret1.extend(ret2)
         return ret1
 
     @staticmethod
-    def open(name):
+    def open(name, progress=None):
+        """Open name as the matching kind of ImageSet.
+
+        progress: passed to sets that index in the background.
+        """
         if isinstance(name, (list, tuple)):
             return ImList(name)
         elif os.path.isdir(name):
+            names, kinds = listing(name)
+            if 'i' not in kinds:
+                if 'v' in kinds:
+                    return ConcatVid(name)
+                if 'd' in kinds:
+                    return ImTree(name)
             return ImDir(name)
         else:
             if name.endswith('.zip'):
                 return ZipSet(name)
+            if tarcompression(name) is not None:
+                return TarSet(name, progress)
+            if name.endswith(ManifestSet.EXTS):
+                return ManifestSet(name)
             tp, enc = mimetypes.guess_type(name)
             if tp is None:
                 raise Exception('unknown mimetype for {}'.format(name))
@@ -223,27 +558,32 @@ class ImageSet(object):
                 if basetype == 'video':
                     return Vid(name)
                 elif basetype == 'image':
+                    if (
+                            os.path.splitext(name)[1].lower() in PageSet.EXTS
+                            and PageSet.pagecount(name) > 1):
+                        return PageSet(name)
                     return ImDir(name)
                 else:
                     raise Exception(
                         'No handling for detected mimetype {} of "{}"'.format(
                             tp, name))
 
-    def next(self, offset=1):
-        """Return next image set."""
+    def next(self, offset=1, progress=None):
+        """Return next image set.  progress is as for open()."""
         dirname = self.dir
-        fnames = os.listdir(dirname)
-        fnames.sort(key=self._numsort_key)
+        fnames, kinds = listing(dirname)
         pick = min(max(fnames.index(self.name)+offset, 0), len(fnames)-1)
         if offset > 0:
             order = chain(range(pick, len(fnames)), range(pick))
         else:
             order = chain(range(pick, -1, -1), range(len(fnames)-1, pick, -1))
         for candidate in order:
+            if kinds[candidate] == '-':
+                continue
             fullpath = os.path.join(dirname, fnames[candidate])
             if os.path.normpath(fullpath) != self.path:
                 try:
-                    return self.open(fullpath)
+                    return self.open(fullpath, progress)
                 except Exception as e:
                     print(e, file=sys.stderr)
         return None
@@ -257,13 +597,19 @@ class ImageSet(object):
         return self._getitem(
             self._normkey(self.index if key is None else key, offset))
 
-    def __call__(self, key, offset=0, callback=None):
+    def __call__(self, key, offset=0, callback=None, reduce=1):
         """Return (imname, np.ndarray) of image.
 
         key: index or (index, offset).
             int: index into the list
             str: index of str
             None: current index
+        callback: if given, load asynchronously and call
+            callback(imname, frame) instead of returning.
+        reduce: 1, or 2, 4, 8 to decode a bgr preview at 1/reduce
+            size.  Requires a callback and PREVIEW.  The callback is
+            called with (imname, frame, reduce) where reduce is 1 if
+            the full frame was already cached.
         Retrieving an item also changes the current index to the
         index of the returned item.
         Failture to decode an image will result in None for the image.
@@ -271,19 +617,204 @@ class ImageSet(object):
         """
         if key is None:
             key = self.index
-        index = self.index = self._normkey(key, offset)
+        if offset:
+            self.step = offset
+        index = self._normkey(key, offset)
+        if offset and self.badframes is not None:
+            index = self._skipbad(index, offset)
+        else:
+            self.skipped = []
+        self.index = index
         if callback is None:
-            return self._getframe(index)
+            return self._load(index)
+        else:
+            self.loop.put(self._async, (index, callback, reduce))
+            step = self.step
+            for i in range(1, self.PREFETCH+1):
+                target = self._normkey(index, step*i)
+                if target == self._normkey(index, step*(i-1)):
+                    break
+                self.loop.put(self._prefetch, (target, reduce), Loop.PREFETCH)
+
+    def _skipbad(self, index, offset):
+        """Return first good index from index in direction of offset.
+
+        Update skipped with names of bad frames passed.  If there are
+        no good frames that way, return index.
+        """
+        bad = self.badframes
+        if bad is None or not 0 <= index < len(bad):
+            self.skipped = []
+            return index
+        step = 1 if offset > 0 else -1
+        end = len(bad) if step > 0 else -1
+        target = index
+        while target != end and bad[target]:
+            target += step
+        if target == end or target == index:
+            self.skipped = []
+            return index
+        self.skipped = [
+            self._getitem(i)[1] for i in range(index, target, step)]
+        print('skipped bad frames', self.skipped, file=sys.stderr)
+        return target
+
+    def uri(self):
+        """Return argument to reopen this set with its class."""
+        return self.path
+
+    def frametime(self, idx):
+        """Return mtime of frame idx's source (for thumbnail keys).
+
+        Default to the mtime of the whole set.
+        """
+        return os.path.getmtime(self.path)
+
+    def complete(self):
+        """Return whether all names are known (not still listing)."""
+        return True
+
+    def _renamed(self):
+        """Drop state indexed by position after the names change.
+
+        A running validate() is forgotten so its result is not used.
+        """
+        self.nameindex = None
+        self.badframes = None
+        self.skipped = []
+        self.validator = None
+
+    def loadbad(self):
+        """Load bad frames from a previous validate() if available.
+
+        The sidecar is the frame count followed by the bad indices and
+        is only used if the count matches a complete set.
+        """
+        if os.path.exists(self.path) and self.complete():
+            data = sidecar.loadarray(self.path, 'badidx')
+            if data is not None and len(data) and data[0] == len(self):
+                bad = np.zeros(len(self), bool)
+                bad[data[1:]] = True
+                self.badframes = bad
+        return self.badframes is not None
+
+    def validate(self, callback=None, processes=None, chunk=64):
+        """Find bad frames in the background.
+
+        Frames are decoded in chunks by a pool of processes which each
+        reopen the set from its class and uri().  The result is saved
+        as a sidecar.
+        callback: called with self (from a thread) when done.
+        Sets that are still listing are not validated since the workers
+        would not see the same frames.
+        """
+        if self.validator is not None:
+            return
+        if not self.complete():
+            print(
+                'not validating', self.path, 'until listing finishes',
+                file=sys.stderr)
+            return
+        args = [
+            (type(self), self.uri(), start, min(start+chunk, len(self)))
+            for start in range(0, len(self), chunk)]
+        self.validator = _daemon(
+            self._validate, weakref.ref(self), args, processes, callback)
+
+    @staticmethod
+    def _validate(ref, args, processes, callback):
+        if sys.version_info.major > 2:
+            context = multiprocessing.get_context('spawn')
         else:
-            self.loop.put(self._async, (index, callback))
+            context = multiprocessing
+        bad = np.zeros(args[-1][-1] if args else 0, bool)
+        pool = context.Pool(processes, initializer=_validate_init)
+        try:
+            for start, badidxs in pool.imap_unordered(_validate_chunk, args):
+                if _exiting.is_set() or ref() is None:
+                    return
+                bad[badidxs] = True
+        finally:
+            pool.terminate()
+        self = ref()
+        if self is None or self.validator is not threading.current_thread():
+            return
+        self.validator = None
+        if len(bad) != len(self):
+            return
+        self.badframes = bad
+        if os.path.exists(self.path):
+            sidecar.savearray(
+                self.path, 'badidx', np.r_[len(bad), np.flatnonzero(bad)])
+        if callback is not None:
+            callback(self)
 
     def _async(self, info):
-        idx, callback = info
-        callback(*self._getframe(idx))
+        idx, callback, reduce = info
+        if reduce == 1:
+            name, im = self._load(idx)
+            self.loop.deliver(callback, name, im)
+        else:
+            ret = self.CACHE.get(self._key(idx))
+            if ret is None:
+                ret = self._load(idx, reduce)
+            else:
+                reduce = 1
+            self.loop.deliver(callback, ret[0], ret[1], reduce)
+
+    def _prefetch(self, info):
+        """Decode idx into the cache if not already cached."""
+        idx, reduce = info
+        if self._key(idx, reduce) not in self.CACHE:
+            ret = self._read(idx, reduce)
+            self.CACHE.put(self._namekey(ret[0], reduce), ret)
+
+    def _key(self, idx, reduce=1):
+        """Return the CACHE key for idx."""
+        return self._namekey(self._getitem(idx)[1], reduce)
+
+    def _namekey(self, name, reduce=1):
+        """Return the CACHE key for frame name."""
+        if reduce == 1:
+            return (self.path, name)
+        else:
+            return (self.path, name, reduce)
+
+    def _load(self, idx, reduce=1):
+        """Return (name, frame) from cache or decode it.
 
+        Frames are cached under the name _read returned since names
+        can shift (watched or sniffed sets) between _key and _read.
+        """
+        ret = self.CACHE.get(self._key(idx, reduce))
+        if ret is None:
+            ret = self._read(idx, reduce)
+            self.CACHE.put(self._namekey(ret[0], reduce), ret)
+        return ret
+
+    def _read(self, idx, reduce=1):
+        """Call _getframe, serialized if not THREADSAFE."""
+        if self.THREADSAFE:
+            return self._getframe(idx, reduce)
+        with self.readlock:
+            return self._getframe(idx, reduce)
+
+    def _lookup(self, name, pick=None):
+        """Return index of name using a lazily built NameIndex.
+
+        Subclasses should call _renamed() when names change.
+        """
+        index = self.nameindex
+        if index is None:
+            index = self.nameindex = NameIndex(self._names())
+        return index.find(name, pick)
+
+    def _names(self):
+        """Return list of frame names (for _lookup)."""
+        raise NotImplementedError
     def _normkey(self, key, offset):
         raise NotImplementedError
-    def _getframe(self, idx):
+    def _getframe(self, idx, reduce=1):
         raise NotImplementedError
     def _getitem(self, idx):
         raise NotImplementedError
@@ -291,9 +822,51 @@ class ImageSet(object):
         raise NotImplementedError
 
     def resync(self):
-        """Resync image source."""
+        """Resync image source, dropping any cached frames."""
+        with self.readlock:
+            self._resync()
+        self._renamed()
+        self.CACHE.discard(self.path)
+
+    def _resync(self):
         pass
 
+# sets opened by validation workers
+_validating = {}
+def _validate_init():
+    """Initialize a validation worker process."""
+    # each worker would rebuild the seek index otherwise
+    Vid.INDEX = False
+
+def _validate_chunk(args):
+    """Return (start, bad indices) for frames start to stop of a set."""
+    cls, uri, start, stop = args
+    key = (cls, tuple(uri) if isinstance(uri, list) else uri)
+    imset = _validating.get(key)
+    if imset is None:
+        imset = _validating[key] = cls(uri)
+    bad = []
+    for idx in range(start, stop):
+        try:
+            name, frame = imset._getframe(idx)
+        except Exception:
+            frame = None
+        if frame is None:
+            bad.append(idx)
+    return start, bad
+
+class KeyView(object):
+    """Sequence of key(item) for items, for use with bisect."""
+    def __init__(self, items, key):
+        self.items = items
+        self.key = key
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, idx):
+        return self.key(self.items[idx])
+
 class ImList(ImageSet):
     """Represent custom selection of images.
 
@@ -308,34 +881,429 @@ class ImList(ImageSet):
         self.filenames = sorted(uri, key=self._numsort_key)
 
     def _normkey(self, key, offset):
-        if isinstance(k, str):
-            key = findfkey(key, self.filenames)
+        if isinstance(key, str):
+            key = self._lookup(key)
         return min(max(key+offset, 0), len(self.filenames)-1)
 
-    def _getframe(self, idx):
+    def _getframe(self, idx, reduce=1):
         fname = self.filenames[idx]
         try:
-            with open(fname, 'rb') as f:
-                im = cv2.imdecode(np.frombuffer(f.read(), np.uint8), -1)
-        except IOError:
+            im = decodefile(fname, reduce)
+        except EnvironmentError:
             im = None
         return fname, im
 
     def _getitem(self, idx):
         return idx, self.filenames[idx]
 
+    def _names(self):
+        return self.filenames
+
+    def uri(self):
+        return self.filenames
+
+    def frametime(self, idx):
+        return os.path.getmtime(self.filenames[idx])
+
     def __len__(self):
         return len(self.filenames)
 
-    def resync(self):
+    def _resync(self):
         """Custom set of images does not change."""
         pass
 
+_sepb = os.sep.encode('utf-8')
+# Name hashes are polynomials in _HASHMUL mod 2**64 so many spans of a
+# buffer are hashed with one cumsum and hashes are stable across runs.
+_HASHMUL = 0x100000001b3
+_hashpows = (np.ones(1, np.uint64), np.ones(1, np.uint64))
+
+def _hashpowers(n):
+    """Return (powers, inverse powers) of _HASHMUL, at least n long."""
+    global _hashpows
+    pows = _hashpows
+    if len(pows[0]) < n:
+        size = max(n, 2*len(pows[0]))
+        inv = _HASHMUL
+        for _ in range(6):
+            inv = inv * (2 - _HASHMUL*inv) % 2**64
+        pows = []
+        for mul in (_HASHMUL, inv):
+            arr = np.full(size, mul, np.uint64)
+            arr[0] = 1
+            pows.append(np.cumprod(arr, dtype=np.uint64))
+        pows = _hashpows = tuple(pows)
+    return pows
+
+def _spanhashes(buf, *spans):
+    """Return uint64 hashes of buf[start:end] for each (starts, ends).
+
+    buf is a uint8 array.
+    """
+    pows, invs = _hashpowers(len(buf))
+    prefix = np.zeros(len(buf)+1, np.uint64)
+    np.cumsum(buf * invs[:len(buf)], out=prefix[1:])
+    return [
+        (prefix[ends] - prefix[starts]) * pows[starts]
+        for starts, ends in spans]
+
+class ManifestSet(ImageSet):
+    """Image paths listed in a text file, one per line.
+
+    Lines are used in file order.  Relative paths are relative to the
+    manifest's directory.  The file is mmapped and only an array of
+    line offsets is kept (saved as a sidecar), paths are decoded by
+    index when needed.  Empty lines are ignored.  Name lookups use
+    sorted arrays of line and basename hashes, built HASHCHUNK bytes
+    at a time in the background and saved as a sidecar.
+    """
+    EXTS = ('.txt', '.lst')
+    CHUNK = 64*1024*1024
+    HASHCHUNK = 1024*1024
+    def __init__(self, uri):
+        super(ManifestSet, self).__init__(uri)
+        self.mm = None
+        self.starts = np.zeros(0, np.uint32)
+        self.stamp = None
+        # rows: line hashes, line idxs, base hashes, line idxs, each
+        # pair sorted by hash
+        self.hashes = None
+        self.hashlock = threading.Lock()
+        self._resync()
+
+    def _resync(self):
+        """Remap the manifest and reindex if changed."""
+        try:
+            curname = self._line(self.index)
+        except Exception:
+            curname = None
+        stamp = sidecar.stamp(self.path)
+        try:
+            with open(self.path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            mm = None
+        starts = sidecar.loadarray(self.path, 'lines')
+        if starts is None:
+            starts = self._build_index(mm)
+            sidecar.savearray(self.path, 'lines', starts, stamp)
+        with self.hashlock:
+            self.mm = mm
+            self.starts = starts
+            self.stamp = stamp
+            self.hashes = sidecar.loadarray(self.path, 'linehash')
+            if self.hashes is not None and (
+                    self.hashes.shape != (4, len(starts))):
+                self.hashes = None
+        if self.hashes is None:
+            _daemon(self._prehash, weakref.ref(self))
+        if curname is not None:
+            try:
+                self.index = self._lookup(curname)
+                return
+            except KeyError:
+                pass
+        self.index = 0
+
+    @classmethod
+    def _build_index(cls, mm):
+        """Return array of offsets of nonempty lines in mm."""
+        if mm is None:
+            return np.zeros(0, np.uint32)
+        size = len(mm)
+        dtype = np.uint32 if size < 2**32 else np.uint64
+        chunks = [np.zeros(1, dtype)]
+        for offset in range(0, size, cls.CHUNK):
+            count = min(cls.CHUNK, size-offset)
+            buf = np.frombuffer(mm, np.uint8, count, offset)
+            newlines = np.flatnonzero(buf == 10)
+            del buf
+            newlines += offset + 1
+            chunks.append(newlines.astype(dtype))
+        starts = np.concatenate(chunks)
+        ends = np.empty_like(starts)
+        ends[:-1] = starts[1:] - 1
+        ends[-1] = size
+        # strip \r so \r\n lines are empty too
+        nonempty = ends > starts
+        crlf = ends[nonempty] - starts[nonempty] == 1
+        if crlf.any():
+            idxs = np.flatnonzero(nonempty)[crlf]
+            nonempty[idxs] = np.frombuffer(
+                mm, np.uint8)[starts[idxs].astype(np.intp)] != 13
+        return starts[nonempty]
+
+    def _line(self, idx):
+        """Return line idx as text."""
+        start = int(self.starts[idx])
+        end = self.mm.find(b'\n', start)
+        if end < 0:
+            end = len(self.mm)
+        return self.mm[start:end].rstrip(b'\r').decode('utf-8')
+
+    @staticmethod
+    def _basename(line):
+        """Return basename of line (bytes)."""
+        line = line.rpartition(b'/')[2]
+        if _sepb != b'/':
+            line = line.rpartition(_sepb)[2]
+        return line
+
+    @staticmethod
+    def _prehash(ref):
+        self = ref()
+        if self is not None and not _exiting.is_set():
+            self._hashindex()
+
+    def _hashindex(self):
+        """Return hashes (see __init__), building them if needed."""
+        with self.hashlock:
+            hashes = self.hashes
+            if hashes is None:
+                hashes = self.hashes = self._hashlines(self.mm, self.starts)
+                if os.path.exists(self.path):
+                    sidecar.savearray(
+                        self.path, 'linehash', hashes, self.stamp)
+        return hashes
+
+    @classmethod
+    def _hashlines(cls, mm, starts):
+        """Return hashes of the lines at starts and their basenames.
+
+        Lines are hashed HASHCHUNK bytes at a time to bound memory.
+        """
+        nlines = len(starts)
+        lhashes = np.empty(nlines, np.uint64)
+        bhashes = np.empty(nlines, np.uint64)
+        sepb = np.frombuffer(_sepb, np.uint8)[0]
+        first = 0
+        while first < nlines:
+            lo = int(starts[first])
+            last = max(int(np.searchsorted(
+                starts, lo + cls.HASHCHUNK, 'left')), first+1)
+            hi = int(starts[last]) if last < nlines else len(mm)
+            buf = np.frombuffer(mm, np.uint8, hi-lo, lo)
+            lstarts = (starts[first:last] - lo).astype(np.intp)
+            newlines = np.append(np.flatnonzero(buf == 10), len(buf))
+            ends = newlines[np.searchsorted(newlines, lstarts)]
+            ends -= buf[ends-1] == 13
+            seps = np.flatnonzero((buf == 47) | (buf == sepb))
+            lastsep = np.append(-1, seps)[np.searchsorted(seps, ends)]
+            bstarts = np.where(lastsep >= lstarts, lastsep+1, lstarts)
+            lhashes[first:last], bhashes[first:last] = _spanhashes(
+                buf, (lstarts, ends), (bstarts, ends))
+            del buf
+            first = last
+        hashes = np.empty((4, nlines), np.uint64)
+        for row, vals in ((0, lhashes), (2, bhashes)):
+            order = np.argsort(vals)
+            hashes[row] = vals[order]
+            hashes[row+1] = order
+        return hashes
+
+    @staticmethod
+    def _hashname(name):
+        """Return hash of name (bytes) as _hashlines would."""
+        buf = np.frombuffer(name, np.uint8)
+        return _spanhashes(buf, ([0], [len(buf)]))[0][0]
+
+    def _lookup(self, name, pick=None):
+        """Return index of the line that is name.
+
+        If no line matches exactly, use the first line ending with
+        /name.  Hash hits are confirmed against the line.
+        """
+        if self.mm is None:
+            raise KeyError('bad key {}'.format(name))
+        target = name.encode('utf-8')
+        lhashes, lidxs, bhashes, bidxs = self._hashindex()
+        for idx in self._candidates(lhashes, lidxs, self._hashname(target)):
+            if self._line(idx) == name:
+                return idx
+        seps = tuple(sep + name for sep in {'/', os.sep})
+        for idx in self._candidates(
+                bhashes, bidxs, self._hashname(self._basename(target))):
+            if self._line(idx).endswith(seps):
+                return idx
+        raise KeyError('bad key {}'.format(name))
+
+    @staticmethod
+    def _candidates(hashes, idxs, val):
+        """Return line idxs whose hash is val, in line order."""
+        lo = np.searchsorted(hashes, val, 'left')
+        hi = np.searchsorted(hashes, val, 'right')
+        return sorted(map(int, idxs[lo:hi]))
+
+    def _normkey(self, key, offset):
+        if isinstance(key, str):
+            key = self._lookup(key)
+        return min(max(key+offset, 0), len(self.starts)-1)
+
+    def _getframe(self, idx, reduce=1):
+        imname = self._line(idx)
+        fullpath = os.path.join(self.dir, imname)
+        try:
+            im = decodefile(fullpath, reduce)
+        except EnvironmentError:
+            im = None
+        return imname, im
+
+    def _getitem(self, idx):
+        return idx, self._line(idx)
+
+    def frametime(self, idx):
+        return os.path.getmtime(os.path.join(self.dir, self._line(idx)))
+
+    def __len__(self):
+        return len(self.starts)
+
+_pilgray = ('L', 'I', 'I;16', 'I;16L', 'I;16B', 'F')
+class PageSet(ImageSet):
+    """Pages of a multi-page image (tiff stack, animated gif/webp).
+
+    Frame names are str of the page index.  The page count is found
+    once (and saved as a sidecar) and pages are decoded on demand
+    with PIL (cv2 does not seek animated frames correctly).  TIFF
+    pages fall back to cv2.imreadmulti, which walks the pages from
+    the start each time.
+
+    PIL remembers TIFF page offsets once walked, so TIFF pages are
+    read with an open image per thread and going back only decodes
+    the requested page.  Animated GIF/WebP frames are composited, so
+    PIL rewinds to frame 0 and walks forward to go back.  They are
+    read one at a time with one shared image and a rewind also caches
+    the BACKFILL frames before the requested one, so stepping back
+    rewinds once per BACKFILL frames.
+    """
+    PREVIEW = False
+    EXTS = ('.tif', '.tiff', '.gif', '.webp')
+    BACKFILL = 16
+    class Shared(object):
+        """Holder of the PIL image shared by all threads."""
+        im = None
+
+    def __init__(self, uri):
+        super(PageSet, self).__init__(uri)
+        self.tiff = os.path.splitext(self.path)[1].lower() in (
+            '.tif', '.tiff')
+        if not self.tiff:
+            self.THREADSAFE = False
+        self.local = self._newlocal()
+        self._len = self.pagecount(self.path)
+
+    def _newlocal(self):
+        """Return holder of open PIL images (per thread for TIFF)."""
+        if self.tiff:
+            return threading.local()
+        return self.Shared()
+
+    @staticmethod
+    def pagecount(path):
+        """Return number of pages in path (1 for single images)."""
+        count = sidecar.load(path, 'pages')
+        if count is None:
+            stamp = sidecar.stamp(path)
+            count = 0
+            if hasattr(cv2, 'imcount'):
+                try:
+                    count = cv2.imcount(path)
+                except cv2.error:
+                    pass
+            if not count and Image is not None:
+                try:
+                    with Image.open(path) as im:
+                        count = getattr(im, 'n_frames', 1)
+                except Exception:
+                    pass
+            sidecar.save(path, 'pages', count, stamp)
+        return count
+
+    def _normkey(self, key, offset):
+        return min(max(0, int(key)+offset), self._len-1)
+
+    def _getitem(self, idx):
+        return idx, str(idx)
+
+    def _getframe(self, idx, reduce=1):
+        """Return (name, frame).  reduce is ignored (not PREVIEW)."""
+        if not self.tiff:
+            # may have been backfilled while waiting for readlock
+            ret = self.CACHE.get(self._namekey(str(idx)))
+            if ret is not None:
+                return ret
+        im = None
+        if Image is not None:
+            try:
+                im = self._pilpage(idx)
+            except Exception:
+                self.local.im = None
+        if im is None and self.tiff:
+            try:
+                success, pages = cv2.imreadmulti(
+                    self.path, idx, 1, flags=cv2.IMREAD_UNCHANGED)
+                if success and pages:
+                    im = pages[0]
+            except cv2.error:
+                pass
+        return str(idx), im
+
+    def _pilpage(self, idx):
+        """Return page idx decoded by PIL, channels in bgr(a) order.
+
+        Animated frames passed while rewinding are cached (BACKFILL).
+        """
+        local = self.local
+        pim = getattr(local, 'im', None)
+        if pim is None:
+            pim = local.im = Image.open(self.path)
+        if not self.tiff and idx < pim.tell():
+            for prev in range(max(idx-self.BACKFILL, 0), idx):
+                key = self._namekey(str(prev))
+                pim.seek(prev)
+                if key not in self.CACHE:
+                    self.CACHE.put(key, (str(prev), self._pilarray(pim)))
+        pim.seek(idx)
+        return self._pilarray(pim)
+
+    @staticmethod
+    def _pilarray(pim):
+        """Return current frame of PIL image pim as bgr(a) ndarray."""
+        mode = pim.mode
+        if mode in _pilgray:
+            im = np.asarray(pim)
+            if not im.dtype.isnative:
+                im = im.astype(im.dtype.newbyteorder('='))
+            return im
+        elif mode == 'RGB':
+            return cv2.cvtColor(np.asarray(pim), cv2.COLOR_RGB2BGR)
+        elif 'A' in mode or 'transparency' in pim.info:
+            return cv2.cvtColor(
+                np.asarray(pim.convert('RGBA')), cv2.COLOR_RGBA2BGRA)
+        return cv2.cvtColor(np.asarray(pim.convert('RGB')), cv2.COLOR_RGB2BGR)
+
+    def __len__(self):
+        return self._len
+
+    def _resync(self):
+        """Recount pages and reopen."""
+        self.local = self._newlocal()
+        self._len = self.pagecount(self.path)
+
 class ImDir(ImageSet):
     """Represent a dir containing images.
 
-    Does not check subdirectories.
+    Does not check subdirectories.  The sorted listing is updated
+    incrementally: nothing is done if the directory mtime is
+    unchanged, otherwise only added names are sorted and inserted.
+    The listing is saved as a sidecar manifest so reopening an
+    unchanged directory does not list or sort it.  watch() polls for
+    changes in the background.
+
+    Only entries with image extensions are frames.  sniff() checks
+    file headers in the background and drops files that are not
+    images.  The results are saved as a sidecar.
     """
+    SNIFFERS = 8
     def __init__(self, uri):
         """If uri is a file, use its containing dir."""
         if os.path.isdir(uri):
@@ -346,52 +1314,443 @@ class ImDir(ImageSet):
             if not name:
                 name = '.'
         super(ImDir, self).__init__(name)
-        self.basenames = [start]
-        self.resync()
+        self.lock = threading.Lock()
+        self.watcher = None
+        # name: whether header looked like an image, None if not sniffing
+        self.sniffed = None
+        self.sniffcallback = None
+        self.bad = set()
+        self.mtime = sidecar.stamp(self.path)[0]
+        names, kinds = listing(self.path)
+        self.names = names
+        self.kinds = list(kinds)
+        self._filter()
+        if start:
+            try:
+                self.index = self._find(start)
+            except ValueError:
+                pass
 
     def __len__(self):
         return len(self.basenames)
 
     def _normkey(self, key, offset):
         if isinstance(key, str):
-            key = findfkey(key, self.basenames)
+            key = self._lookup(key)
         return min(max(key+offset, 0), len(self.basenames)-1)
 
-    def _getframe(self, idx):
+    def _getframe(self, idx, reduce=1):
         imname = self.basenames[idx]
         fullpath = os.path.join(self.path, imname)
         try:
-            with open(fullpath, 'rb') as f:
-                im = cv2.imdecode(np.frombuffer(f.read(), np.uint8), -1)
-        except IOError:
+            im = decodefile(fullpath, reduce)
+        except EnvironmentError:
             im = None
         return imname, im
 
     def _getitem(self, index):
         return index, self.basenames[index]
 
-    def resync(self):
+    def frametime(self, idx):
+        return os.path.getmtime(os.path.join(self.path, self.basenames[idx]))
+
+    def _names(self):
+        return self.basenames
+
+    def _find(self, name):
+        """Return index of name in basenames via bisect."""
+        key = self._numsort_key
+        idx = bisect.bisect_left(KeyView(self.basenames, key), key(name))
+        if idx < len(self.basenames) and self.basenames[idx] == name:
+            return idx
+        raise ValueError('{} not in {}'.format(name, self.path))
+
+    def _filter(self):
+        """Update basenames from names.
+
+        Keep images that were not found bad by sniff().
+        """
+        bad = self.bad
+        self.basenames = [
+            name for name, kind in zip(self.names, self.kinds)
+            if kind == 'i' and name not in bad]
+
+    def sniff(self, callback=None):
+        """Check headers of unchecked images in the background.
+
+        callback: called with self (from the thread) if frames were
+            removed.  Images added by update() are also sniffed.
+        """
+        with self.lock:
+            self.sniffcallback = callback
+            if self.sniffed is None:
+                self.sniffed = sidecar.load(self.path, 'sniff') or {}
+                self.bad = set(
+                    name for name, ok in self.sniffed.items() if not ok)
+        _daemon(self._sniff, weakref.ref(self))
+
+    @staticmethod
+    def _sniff(ref):
+        self = ref()
+        if self is None:
+            return
+        with self.lock:
+            stamp = sidecar.stamp(self.path)
+            sniffed = self.sniffed
+            todo = [
+                name for name, kind in zip(self.names, self.kinds)
+                if kind == 'i' and name not in sniffed]
+            callback = self.sniffcallback
+        dirname = self.path
+        self = None
+        if todo:
+            pool = ThreadPool(ImDir.SNIFFERS)
+            try:
+                results = pool.map(
+                    sniff, [os.path.join(dirname, name) for name in todo],
+                    chunksize=64)
+            finally:
+                pool.close()
+            if _exiting.is_set():
+                return
+        else:
+            results = []
+        self = ref()
+        if self is None:
+            return
+        with self.lock:
+            sniffed.update(zip(todo, results))
+            bad = set(name for name, ok in zip(todo, results) if not ok)
+            if bad:
+                try:
+                    curname = self.basenames[self.index]
+                except IndexError:
+                    curname = None
+                self.bad.update(bad)
+                self._filter()
+                self._renamed()
+                if curname is None or curname in bad:
+                    self.index = min(
+                        self.index, max(len(self.basenames)-1, 0))
+                else:
+                    self.index = self._find(curname)
+            sidecar.save(dirname, 'sniff', sniffed, stamp)
+        if bad and callback is not None:
+            callback(self)
+
+    def update(self, force=False):
+        """Sync with the directory, preserving the current frame.
+
+        force: Relist even if directory mtime did not change.
+        Return whether anything changed.
+        """
+        with self.lock:
+            stamp = sidecar.stamp(self.path)
+            if stamp[0] == self.mtime and not force:
+                return False
+            self.mtime = stamp[0]
+            entries = scan(self.path)
+            added = set(entries).difference(self.names)
+            removed = set(self.names).difference(entries)
+            if not (added or removed):
+                return False
+            try:
+                curname = self.basenames[self.index]
+            except IndexError:
+                curname = None
+            key = self._numsort_key
+            if len(added) > len(self.names) // 8:
+                names = sorted(entries, key=key)
+                kinds = [entries[name] for name in names]
+            else:
+                names = self.names
+                kinds = self.kinds
+                if removed:
+                    keep = [
+                        i for i, name in enumerate(names)
+                        if name not in removed]
+                    names = [names[i] for i in keep]
+                    kinds = [kinds[i] for i in keep]
+                view = KeyView(names, key)
+                for name in added:
+                    pos = bisect.bisect_right(view, key(name))
+                    names.insert(pos, name)
+                    kinds.insert(pos, entries[name])
+            self.names = names
+            self.kinds = kinds
+            if self.sniffed is not None:
+                for name in removed:
+                    self.sniffed.pop(name, None)
+                self.bad.difference_update(removed)
+            self._filter()
+            self._renamed()
+            sidecar.save(
+                self.path, 'listing',
+                dict(names=names, kinds=''.join(kinds)), stamp)
+            if curname is None or curname in removed:
+                self.index = min(self.index, max(len(self.basenames)-1, 0))
+            else:
+                self.index = self._find(curname)
+            if self.sniffed is not None and added:
+                _daemon(self._sniff, weakref.ref(self))
+            return True
+
+    def _resync(self):
         """Reload the directory."""
+        self.update(True)
+
+    def watch(self, callback=None, interval=1.0):
+        """Poll for changes in a background thread.
+
+        callback: called with self (from the thread) after a change.
+        interval: seconds between polls.  Polling only stats the
+            directory unless its mtime changed.
+        """
+        self.unwatch()
+        stop = self.watcher = threading.Event()
+        thread = threading.Thread(
+            target=self._watch,
+            args=(weakref.ref(self), stop, callback, interval))
+        thread.daemon = True
+        thread.start()
+
+    def unwatch(self):
+        """Stop watching for changes."""
+        if self.watcher is not None:
+            self.watcher.set()
+            self.watcher = None
+
+    @staticmethod
+    def _watch(ref, stop, callback, interval):
+        while not stop.wait(interval):
+            self = ref()
+            if self is None:
+                return
+            try:
+                if self.update() and callback is not None:
+                    callback(self)
+            except Exception:
+                traceback.print_exc()
+            self = None
+
+class ImTree(ImageSet):
+    """Represent a directory tree of images.
+
+    Names are paths relative to the root in natural sort order.  Only
+    image files are used.  The tree is walked by SCANNERS threads in
+    the background and images are inserted as they are found
+    (preserving the current frame) so frames can be shown before the
+    walk finishes.  The listing is saved as a sidecar when the walk
+    finishes.  If the root is unchanged, the sidecar is used until the
+    walk removes anything that no longer exists.
+    """
+    SCANNERS = 8
+    def __init__(self, uri):
+        super(ImTree, self).__init__(uri)
+        self.lock = threading.Lock()
+        # set when there is a frame or the walk is done
+        self.ready = threading.Event()
+        self.done = threading.Event()
+        self.callback = None
+        self.interval = 1.0
+        self.notified = 0
+        self.names = sidecar.load(self.path, 'tree') or []
+        self.present = set(self.names)
+        if self.names:
+            self.ready.set()
+        self._walk()
+        self.ready.wait()
+
+    def __len__(self):
+        return len(self.names)
+
+    def _normkey(self, key, offset):
+        if isinstance(key, str):
+            key = self._lookup(key)
+        return min(max(key+offset, 0), len(self.names)-1)
+
+    def _getframe(self, idx, reduce=1):
+        imname = self.names[idx]
+        fullpath = os.path.join(self.path, imname)
         try:
-            curname = self.basenames[self.index]
-        except Exception:
-            curname = None
-        self.basenames = sorted(os.listdir(self.path), key=self._numsort_key)
-        if curname:
+            im = decodefile(fullpath, reduce)
+        except EnvironmentError:
+            im = None
+        return imname, im
+
+    def _getitem(self, index):
+        return index, self.names[index]
+
+    def frametime(self, idx):
+        return os.path.getmtime(os.path.join(self.path, self.names[idx]))
+
+    def _names(self):
+        return self.names
+
+    def _find(self, name):
+        """Return index of name in names via bisect."""
+        key = self._numsort_key
+        idx = bisect.bisect_left(KeyView(self.names, key), key(name))
+        if idx < len(self.names) and self.names[idx] == name:
+            return idx
+        raise ValueError('{} not in {}'.format(name, self.path))
+
+    def _walk(self):
+        """Start walking the tree in the background."""
+        self.done.clear()
+        dirs = queue.Queue()
+        dirs.put('')
+        found = set()
+        ref = weakref.ref(self)
+        for _ in range(self.SCANNERS):
+            _daemon(self._scanner, ref, self.path, dirs, found)
+        _daemon(
+            self._finish, ref, dirs, found, self.SCANNERS,
+            sidecar.stamp(self.path))
+
+    @staticmethod
+    def _scanner(ref, root, dirs, found):
+        """Scan dirs from the queue until None."""
+        while True:
+            reldir = dirs.get()
+            if reldir is None:
+                return
             try:
-                self.index = self.basenames.index(curname)
-            except ValueError:
-                self.index = 0
-        else:
-            self.index = 0
+                if ref() is None or _exiting.is_set():
+                    continue
+                images = []
+                for name, kind in scan(os.path.join(root, reldir)).items():
+                    relname = os.path.join(reldir, name) if reldir else name
+                    if kind == 'd':
+                        dirs.put(relname)
+                    elif kind == 'i':
+                        images.append(relname)
+                self = ref()
+                if self is not None:
+                    self._add(images, found)
+                self = None
+            except EnvironmentError:
+                pass
+            except Exception:
+                traceback.print_exc()
+            finally:
+                dirs.task_done()
+
+    @staticmethod
+    def _finish(ref, dirs, found, nscanners, stamp):
+        """Wait for the walk, then stop scanners and clean up."""
+        dirs.join()
+        for _ in range(nscanners):
+            dirs.put(None)
+        self = ref()
+        if self is None:
+            return
+        if not _exiting.is_set():
+            self._remove(found)
+            sidecar.save(self.path, 'tree', self.names, stamp)
+        self.done.set()
+        self.ready.set()
+        if self.badframes is None:
+            self.loadbad()
+        self._notify(True)
+
+    def _add(self, images, found):
+        """Insert newly found images."""
+        key = self._numsort_key
+        with self.lock:
+            found.update(images)
+            new = [name for name in images if name not in self.present]
+            if not new:
+                return
+            self.present.update(new)
+            names = self.names
+            if len(new) > len(names) // 8:
+                curname = names[self.index] if names else None
+                names = self.names = sorted(names + new, key=key)
+                if curname is not None:
+                    self.index = self._find(curname)
+            else:
+                view = KeyView(names, key)
+                index = self.index
+                for name in new:
+                    pos = bisect.bisect_right(view, key(name))
+                    names.insert(pos, name)
+                    if pos <= index and len(names) > 1:
+                        index += 1
+                self.index = index
+            self._renamed()
+        self.ready.set()
+        self._notify()
+
+    def _remove(self, found):
+        """Remove names that were not found by the walk."""
+        with self.lock:
+            removed = self.present.difference(found)
+            if not removed:
+                return
+            try:
+                curname = self.names[self.index]
+            except IndexError:
+                curname = None
+            self.names = [
+                name for name in self.names if name not in removed]
+            self.present.difference_update(removed)
+            self._renamed()
+            if curname is None or curname in removed:
+                self.index = min(self.index, max(len(self.names)-1, 0))
+            else:
+                self.index = self._find(curname)
+
+    def _notify(self, force=False):
+        """Call the watch callback, at most once per interval."""
+        callback = self.callback
+        now = time.time()
+        if callback is not None and (
+                force or now - self.notified >= self.interval):
+            self.notified = now
+            callback(self)
+
+    def complete(self):
+        return self.done.is_set()
+
+    def _resync(self):
+        """Walk the tree again if not already walking."""
+        if self.done.is_set():
+            self._walk()
+
+    def watch(self, callback=None, interval=1.0):
+        """Report changes found by walks.
 
+        callback: called with self (from a scanner thread) after
+            images are added, at most once per interval seconds, and
+            when a walk finishes.
+        """
+        self.callback = callback
+        self.interval = interval
+
+    def unwatch(self):
+        """Stop reporting changes."""
+        self.callback = None
+
+_inplace = (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
 class ZipSet(ImageSet):
-    """Zipped archive of images."""
+    """Zipped archive of images.
+
+    The sorted member names are saved as a sidecar manifest so
+    reopening an unchanged zip does not sort it.
+
+    The archive is mmapped and member data located from its local
+    header.  Stored members are decoded in place and deflated members
+    are inflated from the mapping, so neither shares any file position
+    and several members can be decoded concurrently.  Other members
+    (bzip2, lzma, encrypted) use a ZipFile per thread.
+    """
     def __init__(self, uri):
         super(ZipSet, self).__init__(uri)
-        self.f = self.infos = None
-        self.idx = {}
-        self.resync()
+        self.mm = self.infos = None
+        self.offsets = {}
+        self.local = threading.local()
+        self._resync()
 
     @classmethod
     def _sortkey(cls, thing):
@@ -403,22 +1762,39 @@ class ZipSet(ImageSet):
         """Key for using filename of infos."""
         return info.filename
 
-    def resync(self):
-        """Reopen the zip."""
+    def _resync(self):
+        """Reopen the zip.
+
+        Old mmap and handles are not closed because other threads may
+        still be decoding from them.  They are freed when unreferenced.
+        """
         try:
             curname = self.infos[self.index].filename
         except Exception:
             curname = None
-        if self.f is not None:
-            self.f.close()
-        self.f = zipfile.ZipFile(self.path)
-        self.infos = [
-            info for info in self.f.infolist() if not info.is_dir()]
-        self.infos.sort(key=self._sortkey)
+        stamp = sidecar.stamp(self.path)
+        with open(self.path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with zipfile.ZipFile(self.path) as zf:
+            manifest = sidecar.load(self.path, 'manifest')
+            if manifest is None:
+                infos = [info for info in zf.infolist() if not info.is_dir()]
+                infos.sort(key=self._sortkey)
+                names = [info.filename for info in infos]
+                sidecar.save(
+                    self.path, 'manifest',
+                    dict(names=names, kinds=''.join(map(kindof, names))),
+                    stamp)
+            else:
+                infos = list(map(zf.getinfo, manifest['names']))
+        self.mm = mm
+        self.offsets = {}
+        self.local = threading.local()
+        self.infos = infos
+        self._renamed()
         if curname is not None:
             try:
-                self.index = findfkey(
-                    curname, self.infos, self._fnamekey, pick=0)
+                self.index = self._lookup(curname, pick=0)
                 return
             except KeyError:
                 pass
@@ -426,14 +1802,50 @@ class ZipSet(ImageSet):
 
     def _normkey(self, key, offset):
         if isinstance(key, str):
-            key = findfkey(key, self.infos, self._fnamekey)
+            key = self._lookup(key)
         return min(max(key+offset, 0), len(self.infos)-1)
 
-    def _getframe(self, idx):
+    @staticmethod
+    def _dataoffset(mm, info):
+        """Return offset of info's data in mm or None.
+
+        None if info's data cannot be read from mm directly
+        (encrypted or unsupported compression).
+        """
+        if info.compress_type not in _inplace or info.flag_bits & 1:
+            return None
+        start = info.header_offset
+        if mm[start:start+4] != b'PK\x03\x04':
+            return None
+        namelen, extralen = struct.unpack_from('<HH', mm, start+26)
+        return start + 30 + namelen + extralen
+
+    def _handle(self, local):
+        """Return this thread's ZipFile."""
+        f = getattr(local, 'f', None)
+        if f is None:
+            f = local.f = zipfile.ZipFile(self.path)
+        return f
+
+    def _getframe(self, idx, reduce=1):
+        mm, offsets, local = self.mm, self.offsets, self.local
         info = self.infos[idx]
         try:
-            with self.f.open(info) as imf:
-                im = cv2.imdecode(np.frombuffer(imf.read(), np.uint8), -1)
+            try:
+                offset = offsets[info.filename]
+            except KeyError:
+                offset = offsets[info.filename] = self._dataoffset(mm, info)
+            if offset is None:
+                with self._handle(local).open(info) as imf:
+                    im = decode(imf.read(), reduce)
+            elif info.compress_type == zipfile.ZIP_STORED:
+                im = decode(mm, reduce, offset, info.compress_size)
+            else:
+                im = decode(
+                    zlib.decompress(
+                        mm[offset:offset+info.compress_size], -15,
+                        max(info.file_size, 1)),
+                    reduce)
         except Exception:
             im = None
         return info.filename, im
@@ -441,18 +1853,600 @@ class ZipSet(ImageSet):
     def _getitem(self, index):
         return index, self.infos[index].filename
 
+    def _names(self):
+        return [info.filename for info in self.infos]
+
     def __len__(self):
         return len(self.infos)
 
+def _printprogress(name):
+    """Return a progress(done, total) that prints whole percents."""
+    last = [-1]
+    def progress(done, total):
+        pct = 100 * done // max(total, 1)
+        if pct != last[0]:
+            last[0] = pct
+            print('indexing {}: {}%'.format(name, pct), file=sys.stderr)
+    return progress
+
+def _noprogress(done, total):
+    pass
+
+class TarSet(ImageSet):
+    """Tar archive of images, optionally compressed.
+
+    The member index (sorted names, data offsets, and sizes) is built
+    once in the background and saved as a sidecar.  Members are added
+    as they are found (preserving the current frame) so frames can be
+    shown before indexing finishes, which takes one sequential pass
+    over compressed archives.  Uncompressed tars are mmapped and
+    members decoded in place.  Compressed members are read by seeking
+    decompressed streams.  Forward seeks decompress and discard and
+    backward seeks restart from the beginning, so up to STREAMS
+    streams are kept and the closest one before a member is used.
+    """
+    STREAMS = 2
+    def __init__(self, uri, progress=None):
+        """Initialize TarSet.
+
+        progress: progress(done, total) called with archive bytes
+            (from the indexing thread) while indexing.  Default prints
+            to stderr for compressed tars (uncompressed tars index
+            quickly).
+        """
+        super(TarSet, self).__init__(uri)
+        self.compression = tarcompression(self.path)
+        if self.compression:
+            self.THREADSAFE = False
+        if progress is None:
+            if self.compression:
+                progress = _printprogress(self.name)
+            else:
+                progress = _noprogress
+        self.progress = progress
+        self.lock = threading.Lock()
+        # set when there is a member or indexing is done
+        self.ready = threading.Event()
+        self.done = threading.Event()
+        self.callback = None
+        self.interval = 1.0
+        self.notified = 0
+        # name to restore as current frame once it is indexed again
+        self.want = None
+        self.mm = None
+        self.streams = []
+        self.names = self.offsets = self.sizes = ()
+        self._index()
+        self.ready.wait()
+
+    def _resync(self):
+        """Reindex if the archive changed and not already indexing."""
+        if self.done.is_set():
+            self._index()
+            self.ready.wait()
+
+    def _index(self):
+        """Load the member index or start building it."""
+        try:
+            curname = self.names[self.index]
+        except Exception:
+            curname = None
+        for stream in self.streams:
+            stream.close()
+        self.streams = []
+        stamp = sidecar.stamp(self.path)
+        if not self.compression:
+            with open(self.path, 'rb') as f:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = sidecar.load(self.path, 'tarindex')
+        with self.lock:
+            if data is None:
+                self.done.clear()
+                self.ready.clear()
+                self.names, self.offsets, self.sizes = [], [], []
+                self.want = curname
+                self.index = 0
+            else:
+                self.names = data['names']
+                self.offsets = data['offsets']
+                self.sizes = data['sizes']
+                self.want = None
+                self.index = 0
+                if curname is not None:
+                    try:
+                        self.index = self._find(curname)
+                    except ValueError:
+                        pass
+            self._renamed()
+        if data is None:
+            _daemon(
+                self._indexer, weakref.ref(self), self.path,
+                self.compression, self.progress, stamp)
+        else:
+            self.done.set()
+            self.ready.set()
+
+    @classmethod
+    def _indexer(cls, ref, path, compression, progress, stamp):
+        """Index members, adding them each time their count doubles.
+
+        Only regular files are indexed.  If a name appears multiple
+        times, the last one is used (as with extraction).  The index is
+        only saved if the whole archive was read.
+        """
+        total = os.path.getsize(path)
+        members = {}
+        new = []
+        added = 0
+        if compression:
+            mode = 'r|' + compression
+        else:
+            mode = 'r:'
+        complete = False
+        try:
+            with open(path, 'rb') as raw:
+                with tarfile.open(fileobj=raw, mode=mode) as tf:
+                    for member in tf:
+                        if _exiting.is_set():
+                            return
+                        if member.isreg() and not member.issparse():
+                            if member.name not in members:
+                                new.append(member.name)
+                            members[member.name] = (
+                                member.offset_data, member.size)
+                            if len(new) > added:
+                                self = ref()
+                                if self is None:
+                                    return
+                                self._add(members, new)
+                                self = None
+                                added += len(new)
+                                new = []
+                        progress(raw.tell(), total)
+            complete = True
+        except Exception:
+            traceback.print_exc()
+        progress(total, total)
+        self = ref()
+        if self is None:
+            return
+        self._add(members, new)
+        if complete and not _exiting.is_set():
+            sidecar.save(
+                path, 'tarindex',
+                dict(names=self.names, offsets=self.offsets,
+                     sizes=self.sizes),
+                stamp)
+        self.done.set()
+        self.ready.set()
+        if self.badframes is None:
+            self.loadbad()
+        self._notify(True)
+
+    def _add(self, members, new):
+        """Insert new names and update offsets and sizes of all."""
+        key = self._numsort_key
+        names = self.names
+        if new:
+            names = sorted(names + new, key=key)
+        offsets = [members[name][0] for name in names]
+        sizes = [members[name][1] for name in names]
+        with self.lock:
+            want = self.want
+            if want is None and self.names:
+                want = self.names[self.index]
+            self.names = names
+            self.offsets = offsets
+            self.sizes = sizes
+            if want is not None:
+                try:
+                    self.index = self._find(want)
+                    self.want = None
+                except ValueError:
+                    pass
+            self._renamed()
+        self.ready.set()
+        self._notify()
+
+    def _find(self, name):
+        """Return index of name in names via bisect."""
+        key = self._numsort_key
+        idx = bisect.bisect_left(KeyView(self.names, key), key(name))
+        if idx < len(self.names) and self.names[idx] == name:
+            return idx
+        raise ValueError('{} not in {}'.format(name, self.path))
+
+    def _notify(self, force=False):
+        """Call the watch callback, at most once per interval."""
+        callback = self.callback
+        now = time.time()
+        if callback is not None and (
+                force or now - self.notified >= self.interval):
+            self.notified = now
+            callback(self)
+
+    def watch(self, callback=None, interval=1.0):
+        """Report members added while indexing.
+
+        callback: called with self (from the indexing thread) after
+            members are added, at most once per interval seconds, and
+            when indexing finishes.
+        """
+        self.callback = callback
+        self.interval = interval
+
+    def unwatch(self):
+        """Stop reporting changes."""
+        self.callback = None
+
+    def complete(self):
+        return self.done.is_set()
+
+    def _openstream(self):
+        """Open a decompressed stream of the archive."""
+        if self.compression == 'gz':
+            return gzip.GzipFile(self.path, 'rb')
+        elif self.compression == 'bz2':
+            return bz2.BZ2File(self.path, 'rb')
+        elif self.compression == 'xz' and lzma is not None:
+            return lzma.LZMAFile(self.path, 'rb')
+        raise ValueError(
+            'unsupported tar compression {}'.format(self.compression))
+
+    def _readstream(self, offset, size):
+        """Read size bytes at offset of the decompressed archive."""
+        streams = self.streams
+        best = None
+        bestpos = -1
+        for i, stream in enumerate(streams):
+            pos = stream.tell()
+            if bestpos < pos <= offset:
+                best, bestpos = i, pos
+        if best is not None:
+            stream = streams.pop(best)
+        elif len(streams) < self.STREAMS:
+            stream = self._openstream()
+        else:
+            stream = streams.pop(0)
+        streams.append(stream)
+        stream.seek(offset)
+        return stream.read(size)
+
+    def _normkey(self, key, offset):
+        if isinstance(key, str):
+            key = self._lookup(key)
+        return min(max(key+offset, 0), len(self.names)-1)
+
+    def _getframe(self, idx, reduce=1):
+        mm = self.mm
+        with self.lock:
+            name = self.names[idx]
+            offset = self.offsets[idx]
+            size = self.sizes[idx]
+        try:
+            if mm is None:
+                im = decode(self._readstream(offset, size), reduce)
+            else:
+                im = decode(mm, reduce, offset, size)
+        except Exception:
+            im = None
+        return name, im
+
+    def _getitem(self, index):
+        return index, self.names[index]
+
+    def _names(self):
+        return self.names
+
+    def __len__(self):
+        return len(self.names)
+
+
+class Capture(object):
+    """A cv2.VideoCapture that tracks its own decode position."""
+    def __init__(self, path):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise Exception('Failed to open "{}"'.format(path))
+        # index of the frame that the next grab() will return
+        self.pos = 0
+
+    def seek(self, idx, points):
+        """Position so that the next grab() returns frame idx.
+
+        points: sorted frames where CAP_PROP_POS_FRAMES is accurate.
+            If None, trust CAP_PROP_POS_FRAMES.
+        Return False if the video ended before idx.
+        """
+        cap = self.cap
+        if points is None:
+            if idx < self.pos:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+                self.pos = idx
+        else:
+            point = points[bisect.bisect_right(points, idx)-1]
+            if idx < self.pos or self.pos < point:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, point)
+                self.pos = point
+        while self.pos < idx:
+            if _exiting.is_set() or not cap.grab():
+                return False
+            self.pos += 1
+        return True
+
+    def read(self, idx, points):
+        """Return frame idx or None if it could not be decoded.
+
+        Only frame idx is retrieved, skipped frames are only grabbed.
+        """
+        if self.seek(idx, points) and self.cap.grab():
+            self.pos += 1
+            success, frame = self.cap.retrieve()
+            if success:
+                return frame
+        return None
+
+    def grabs(self, idx, points):
+        """Return the number of grabs to reach idx without seeking.
+
+        Return None if a seek would be needed.
+        """
+        if self.pos <= idx and (
+                points is None
+                or points[bisect.bisect_right(points, idx)-1] <= self.pos):
+            return idx - self.pos
+        return None
+
+    def release(self):
+        self.cap.release()
+
+class CapturePool(object):
+    """Captures of a video parked at different positions.
+
+    Each request uses the idle capture that can reach the frame with
+    the fewest grabs.  If every idle capture would need to seek, a new
+    capture is opened (up to size captures) so the existing ones keep
+    their positions.  Otherwise, the least recently used capture is
+    seeked.
+    """
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.cond = threading.Condition()
+        # idle captures, least recently used first
+        self.idle = [Capture(path)]
+        self.count = 1
+
+    def acquire(self, idx, points):
+        """Return a Capture for exclusive use to read idx."""
+        with self.cond:
+            while 1:
+                best = None
+                for capture in self.idle:
+                    grabs = capture.grabs(idx, points)
+                    if grabs is not None and (
+                            best is None or grabs < best[0]):
+                        best = grabs, capture
+                if best is not None:
+                    self.idle.remove(best[1])
+                    return best[1]
+                if self.count < self.size:
+                    self.count += 1
+                    break
+                if self.idle:
+                    return self.idle.pop(0)
+                self.cond.wait()
+        try:
+            return Capture(self.path)
+        except Exception:
+            with self.cond:
+                self.count -= 1
+                self.cond.notify()
+            raise
+
+    def release(self, capture):
+        """Return a capture from acquire() to the pool."""
+        with self.cond:
+            self.idle.append(capture)
+            self.cond.notify()
+
+    def close(self):
+        """Release idle captures."""
+        with self.cond:
+            for capture in self.idle:
+                capture.release()
+            self.count -= len(self.idle)
+            del self.idle[:]
+
+class VidReader(object):
+    """Read ahead frames of a Vid on a dedicated thread.
+
+    After frame idx is taken with step, frames idx+step, idx+2*step...
+    are decoded with a separate capture into a buffer of up to size
+    frames past the furthest taken frame.  Only frames on the stride
+    are retrieved.  Frames are kept until space is needed so that
+    concurrent takes of nearby frames do not restart reading.
+    """
+    def __init__(self, vid, size):
+        self.capture = Capture(vid.path)
+        self.ref = weakref.ref(vid)
+        self.size = size
+        self.cond = threading.Condition()
+        self.buffer = deque()
+        self.next = None
+        self.step = 1
+        self.taken = None
+        self.decoding = None
+        self.generation = 0
+        self.stopped = False
+        _readers.add(self)
+        _daemon(self._run)
+
+    def take(self, idx, step):
+        """Return frame idx if read ahead, else None.
+
+        Reading ahead continues after idx in the direction of step.
+        If idx is being decoded, wait for it.
+        """
+        with self.cond:
+            buf = self.buffer
+            if step == self.step and (
+                    idx in (self.next, self.decoding)
+                    or self._find(idx) is not None):
+                if (idx - self.taken) * step > 0:
+                    self.taken = idx
+                    self.cond.notify_all()
+                frame = self._find(idx)
+                while frame is None and idx in (self.next, self.decoding):
+                    self.cond.wait()
+                    frame = self._find(idx)
+                if frame is not None:
+                    return frame
+            buf.clear()
+            self.step = step
+            self.taken = idx
+            self.next = idx + step
+            self.generation += 1
+            self.cond.notify_all()
+        return None
+
+    def near(self, idx, step):
+        """Return whether idx is within read ahead of the taken frame."""
+        with self.cond:
+            return (
+                self.taken is not None and step == self.step
+                and 0 <= (idx - self.taken) * step <= self.size)
+
+    def _find(self, idx):
+        """Return buffered frame idx or None."""
+        for i, frame in self.buffer:
+            if i == idx:
+                return frame
+        return None
+
+    def _ahead(self):
+        """Return number of buffered frames past the taken frame."""
+        taken = self.taken
+        step = self.step
+        return sum(1 for i, frame in self.buffer if (i-taken) * step > 0)
+
+    def close(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+    def _run(self):
+        cond = self.cond
+        while 1:
+            with cond:
+                while 1:
+                    vid = self.ref()
+                    if self.stopped or vid is None:
+                        self.capture.release()
+                        return
+                    nxt = self.next
+                    if (
+                            nxt is not None and 0 <= nxt < len(vid)
+                            and self._ahead() < self.size):
+                        break
+                    vid = None
+                    cond.wait(1)
+                generation = self.generation
+                self.decoding = nxt
+            frame = self.capture.read(nxt, vid.seekpoints)
+            vid = None
+            with cond:
+                self.decoding = None
+                if generation == self.generation:
+                    if frame is None:
+                        self.next = None
+                    else:
+                        buf = self.buffer
+                        buf.append((nxt, frame))
+                        self.next = nxt + self.step
+                        while (
+                                len(buf) > self.size
+                                and (buf[0][0]-self.taken) * self.step < 0):
+                            buf.popleft()
+                cond.notify_all()
 
 class Vid(ImageSet):
+    """A video file.
+
+    Frame names are str of the frame index.  Seeking with
+    CAP_PROP_POS_FRAMES is inaccurate for many codecs, so a seek index
+    is built once in the background and saved as a sidecar.  The index
+    has the true frame count and the frames where seeking was verified
+    to give the same frame as sequential decoding (every SEEKSTRIDE
+    frames at most).  Random access then costs one seek plus fewer
+    than SEEKSTRIDE grabs (if every candidate verified).  Until the
+    index is ready, seeking falls back to CAP_PROP_POS_FRAMES.  Set
+    INDEX to False to not build the index.
+
+    A VidReader reads up to READAHEAD frames ahead in the direction of
+    the current step (0 to disable).  Only VISIBLE jobs (which move
+    the playhead) and PREFETCH jobs within read ahead of it use the
+    reader.  Other requests (thumbnails, validation, far prefetches)
+    are served by a CapturePool of up to CAPTURES captures so they do
+    not restart read ahead or destroy each other's decoder position.
+    """
+    PREVIEW = False
+    INDEX = True
+    SEEKSTRIDE = 32
+    READAHEAD = 8
+    CAPTURES = 3
     def __init__(self, vid):
         super(Vid, self).__init__(vid)
-        self.cap = cv2.VideoCapture(self.path)
-        self.cap.grab()
-        if not self.cap.isOpened():
-            raise Exception('Failed to open "{}"'.format(self.path))
-        self._len = self.cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        self.captures = CapturePool(self.path, self.CAPTURES)
+        self.reader = None
+        cap = self.captures.idle[0].cap
+        self._len = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or None
+        self.seekpoints = None
+        index = sidecar.load(self.path, 'seekidx')
+        if index is None:
+            if self.INDEX:
+                _daemon(
+                    self._build_index,
+                    self.path, self.SEEKSTRIDE, weakref.ref(self))
+        else:
+            self._len = index['count']
+            self.seekpoints = index['seekpoints']
+
+    @staticmethod
+    def _build_index(path, stride, ref):
+        """Build the seek index for the video at path.
+
+        Decode sequentially to count frames.  Every stride frames,
+        check that seeking a second capture to that frame gives the
+        same image.  ref is a weakref to the Vid to update. Give up if
+        the Vid is garbage collected.
+        """
+        cap = cv2.VideoCapture(path)
+        probe = cv2.VideoCapture(path)
+        points = [0]
+        count = 0
+        while cap.grab():
+            if _exiting.is_set():
+                return
+            if count and not count % stride:
+                if ref() is None:
+                    return
+                success, frame = cap.retrieve()
+                if success:
+                    probe.set(cv2.CAP_PROP_POS_FRAMES, count)
+                    found, check = probe.read()
+                    if found and np.array_equal(frame, check):
+                        points.append(count)
+            count += 1
+        cap.release()
+        probe.release()
+        sidecar.save(path, 'seekidx', dict(count=count, seekpoints=points))
+        self = ref()
+        if self is not None:
+            with self.loop.lock:
+                self._len = count
+            self.seekpoints = points
 
     def _normkey(self, key, offset):
         with self.loop.lock:
@@ -462,51 +2456,238 @@ class Vid(ImageSet):
     def _getitem(self, idx):
         return idx, str(idx)
 
-    def _getframe(self, idx):
-        cap = self.cap
-        target = idx+1
-        cur = cap.get(cv2.CAP_PROP_POS_FRAMES)
-        if cur > target:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
-            cap.grab()
-        else:
-            while cur < target:
-                if not cap.grab():
-                    break
-                cur += 1
-        success, frame = cap.retrieve()
-        if not success:
-            l = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
-            with self.loop.lock:
-                self._len = l
-            cap.set(cv2.CAP_PROP_POS_FRAMES, l-1)
-            success, frame = cap.read()
-        return str(int(cap.get(cv2.CAP_PROP_POS_FRAMES)-1)), frame
+    def _getframe(self, idx, reduce=1):
+        """Return (name, frame).  reduce is ignored (not PREVIEW)."""
+        if self.READAHEAD:
+            job = getattr(self.LOOP.local, 'job', None)
+            priority = None if job is None else job.priority
+            reader = self.reader
+            if priority == Loop.VISIBLE or (
+                    priority == Loop.PREFETCH and reader is not None
+                    and reader.near(idx, self.step)):
+                if reader is None:
+                    reader = self.reader = VidReader(self, self.READAHEAD)
+                frame = reader.take(idx, self.step)
+                if frame is not None:
+                    return str(idx), frame
+        points = self.seekpoints
+        capture = self.captures.acquire(idx, points)
+        try:
+            frame = capture.read(idx, points)
+            l = capture.pos
+        finally:
+            self.captures.release(capture)
+        if frame is not None:
+            return str(idx), frame
+        # Metadata frame count was too large.
+        with self.loop.lock:
+            self._len = l
+        if 0 < l <= idx:
+            return self._getframe(l-1)
+        return str(idx), None
 
     def __len__(self):
-        if self._len < max(0, cap.get(cv2.CAP_PROP_POS_FRAMES)):
-            while cap.grab():
-                pass
-            self._len = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
-        return self._len
+        with self.loop.lock:
+            return self._len
 
-    def resync(self):
+    def _resync(self):
         """Resync the video.
 
         If this is needed, then that implies that the video has some
-        kind of error.  Frame seeking will be inaccurate so this will
-        seek to the beginning and step back to the current frame number.
+        kind of error.  Reopen the video so the next frame will be
+        decoded from a known position.
         """
-        cap = self.cap
-        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        for i in range(self.index):
-            if not cap.grab():
-                print(
-                    'warning, index/length differs from metadata',
-                    file=sys.stderr)
-                self._len = i
-                self.index = i-1
+        self.captures.close()
+        self.captures = CapturePool(self.path, self.CAPTURES)
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+class ConcatVid(ImageSet):
+    """Directory of videos as one timeline.
+
+    Files are the naturally sorted videos in the directory.  Frame
+    names are 'file:frame'.  Global frame indices are mapped to files
+    through prefix sums of per-file frame counts.  Counts are from the
+    Vid seek index sidecar if present, else capture metadata.  The
+    first file is counted on open and the rest in the background,
+    growing the timeline, then all counts are saved as a sidecar.
+
+    Up to VIDS Vids are kept open (LRU).  When a frame within
+    PREOPEN frames of a file boundary is read, the Vid across the
+    boundary (in the direction of the step) is opened in the
+    background so crossing it does not wait on opening a capture.
+    """
+    PREVIEW = False
+    VIDS = 2
+    PREOPEN = 32
+    def __init__(self, uri):
+        super(ConcatVid, self).__init__(uri)
+        self.lock = threading.Lock()
+        names, kinds = listing(self.path)
+        self.files = [
+            name for name, kind in zip(names, kinds) if kind == 'v']
+        self.fileidx = dict((name, i) for i, name in enumerate(self.files))
+        self.vids = OrderedDict()
+        self.opening = set()
+        self.counts = []
+        self.starts = []
+        self.total = 0
+        data = sidecar.load(self.path, 'concat')
+        if data is not None and data['files'] == self.files:
+            for count in data['counts']:
+                self._append(count)
+        else:
+            stamp = sidecar.stamp(self.path)
+            if self.files:
+                self._append(self._count(self.path, self.files[0]))
+            _daemon(
+                self._countall, weakref.ref(self), self.path,
+                list(self.files), stamp)
+        if self.files:
+            self.fps = self._vid(0).fps
+
+    def _append(self, count):
+        """Add count of next file to the prefix sums."""
+        with self.lock:
+            self.starts.append(self.total)
+            self.counts.append(count)
+            self.total += count
+
+    @staticmethod
+    def _count(dirname, fname):
+        """Return frame count of video fname in dirname."""
+        fullpath = os.path.join(dirname, fname)
+        index = sidecar.load(fullpath, 'seekidx')
+        if index is not None:
+            return index['count']
+        cap = cv2.VideoCapture(fullpath)
+        try:
+            return max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+        finally:
+            cap.release()
+
+    @classmethod
+    def _countall(cls, ref, dirname, files, stamp):
+        """Count remaining files in the background."""
+        self = ref()
+        if self is None:
+            return
+        start = len(self.counts)
+        self = None
+        for fname in files[start:]:
+            if _exiting.is_set():
+                return
+            count = cls._count(dirname, fname)
+            self = ref()
+            if self is None:
                 return
+            self._append(count)
+            self = None
+        self = ref()
+        if self is not None:
+            sidecar.save(
+                dirname, 'concat', dict(files=files, counts=self.counts),
+                stamp)
+            self.loadbad()
+
+    def _locate(self, idx):
+        """Return (file index, frame index in file) for global idx."""
+        with self.lock:
+            fidx = bisect.bisect_right(self.starts, idx) - 1
+            return fidx, idx - self.starts[fidx]
+
+    def _vid(self, fidx):
+        """Return Vid for file fidx, opening it if needed."""
+        with self.lock:
+            vid = self.vids.pop(fidx, None)
+            if vid is not None:
+                self.vids[fidx] = vid
+                return vid
+        vid = Vid(os.path.join(self.path, self.files[fidx]))
+        with self.lock:
+            other = self.vids.pop(fidx, None)
+            if other is not None:
+                vid, other = other, vid
+            self.vids[fidx] = vid
+            evicted = [other] if other is not None else []
+            while len(self.vids) > self.VIDS:
+                evicted.append(self.vids.popitem(False)[1])
+        for old in evicted:
+            self._close(old)
+        return vid
+
+    @staticmethod
+    def _close(vid):
+        """Release a Vid's captures and reader thread."""
+        vid.captures.close()
+        if vid.reader is not None:
+            vid.reader.close()
+
+    def _preopen(self, fidx):
+        """Open Vid fidx in the background if not already open."""
+        with self.lock:
+            if fidx in self.vids or fidx in self.opening:
+                return
+            self.opening.add(fidx)
+        _daemon(self._opener, weakref.ref(self), fidx)
+
+    @staticmethod
+    def _opener(ref, fidx):
+        self = ref()
+        if self is None or _exiting.is_set():
+            return
+        try:
+            self._vid(fidx)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            with self.lock:
+                self.opening.discard(fidx)
+
+    def _normkey(self, key, offset):
+        if isinstance(key, str):
+            fname, sep, frame = key.rpartition(':')
+            fidx = self.fileidx.get(fname)
+            if not sep or fidx is None or not frame.isdigit():
+                raise KeyError('bad key {}'.format(key))
+            with self.lock:
+                key = self.starts[fidx] + int(frame)
+        return min(max(key+offset, 0), len(self)-1)
+
+    def _getitem(self, idx):
+        fidx, frame = self._locate(idx)
+        return idx, '{}:{}'.format(self.files[fidx], frame)
+
+    def _getframe(self, idx, reduce=1):
+        """Return (name, frame).  reduce is ignored (not PREVIEW)."""
+        fidx, frame = self._locate(idx)
+        vid = self._vid(fidx)
+        vid.step = self.step
+        name, im = vid._getframe(frame)
+        count = self.counts[fidx]
+        if self.step > 0 and count - frame <= self.PREOPEN:
+            if fidx + 1 < len(self.counts):
+                self._preopen(fidx + 1)
+        elif self.step < 0 and frame < self.PREOPEN and fidx:
+            self._preopen(fidx - 1)
+        return '{}:{}'.format(self.files[fidx], name), im
+
+    def __len__(self):
+        with self.lock:
+            return self.total
+
+    def complete(self):
+        with self.lock:
+            return len(self.counts) == len(self.files)
+
+    def _resync(self):
+        """Close all open Vids."""
+        with self.lock:
+            vids = list(self.vids.values())
+            self.vids.clear()
+        for vid in vids:
+            self._close(vid)
 
 if __name__ == '__main__':
     import argparse
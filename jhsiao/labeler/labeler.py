@@ -14,7 +14,9 @@ import os
 from collections import defaultdict
 from functools import partial
 import json
+import math
 import pickle
+import time
 from .data import Interpolator, restore_composites, extract_composites
 
 import numpy as np
@@ -27,6 +29,8 @@ from ..labeleritems import ItemSelector, Item, ItemMenu
 from .colorpicker import ColorPicker
 from .dict import Dict
 from .imset import ImageSet, filetypes
+from .grid import GridView
+from .window import Window
 
 class LabelCanv(tk.Canvas, object):
     def __init__(self, *args, **kwargs):
@@ -50,16 +54,36 @@ class LabelCanv(tk.Canvas, object):
         if not self.bind_class(tag):
             tku.add_bindings(self, tag)
 
-    def show(self, im):
-        """Show an image."""
+    def show(self, im, reduce=1, prepared=False):
+        """Show an image.
+
+        reduce: im is 1/reduce of the full resolution, reduce should be
+            a power of zoomfactor.  im is shown at the matching zoom
+            level so items stay in full resolution coordinates.
+        prepared: im is already the result of BgIm.prepare().
+        """
         # unzoom, then show
         antizoom = self.zoomfactor ** (-self.zoom)
         self.scale('Item', 0, 0, antizoom, antizoom)
         for item, info in self.items.values():
             item.rescale(self)
         self.zoom = 0
-        self.bgim.show(self, im)
-        self.master.frameinfo.zoomvar.set('100%')
+        self.bgim.show(self, im, reduce, prepared)
+        if reduce == 1:
+            self.master.frameinfo.zoomvar.set('100%')
+        else:
+            self.zoom = -int(round(math.log(reduce, self.zoomfactor)))
+            self._rezoom()
+            self.master.frameinfo.zoomvar.set(
+                '{:.2f}%'.format(100 / reduce))
+
+    def _rezoom(self):
+        """Scale items at zoom 0 to the current zoom."""
+        if self.zoom:
+            mult = self.zoomfactor ** self.zoom
+            self.scale('Item', 0, 0, mult, mult)
+            for item, info in self.items.values():
+                item.rescale(self)
 
     def create(self, x, y):
         """Create an item."""
@@ -141,6 +165,7 @@ class LabelCanv(tk.Canvas, object):
         for iteminfo in info:
             item = Item.fromdict(self, iteminfo)
             items[item.idns[0]] = (item, iteminfo.get('info', {}))
+        self._rezoom()
         if info:
             self.tag_raise(self.crosshairs.TAG, 'Item')
         self.changed = False
@@ -175,6 +200,15 @@ class LabelCanv(tk.Canvas, object):
         else:
             widget.master.show(None, stepsize)
 
+    @tku.Bindings('<Control-Return>', '<Control-Shift-Return>')
+    def _toggleplay(widget, state):
+        """Start/stop continuous playback, backwards with Shift."""
+        stepsize = int(widget.master.frameinfo.stepsize.get())
+        if state.Shift:
+            widget.master.toggle_play(-stepsize)
+        else:
+            widget.master.toggle_play(stepsize)
+
     @tku.Bindings('<w>', '<W>', '<a>', '<A>', '<s>', '<S>', '<d>', '<D>')
     @staticmethod
     def _wasdmovemouse(widget, x, y, keysym, state):
@@ -271,6 +305,7 @@ class LabelCanv(tk.Canvas, object):
     @staticmethod
     def _debugging(widget):
         master = widget.master
+        print('frame cache', ImageSet.CACHE.stats())
         interp = Interpolator(master.imset, master.labels)
         print('labels')
         print(master.labels)
@@ -295,8 +330,16 @@ class CanvasFrame(tk.Frame, object):
             master, command=self.canv.yview, orient='vertical')
         self.scrolly.grid(row=0, column=1, sticky='ns', in_=self)
         self.canv.configure(
-            xscrollcommand=self.scrollx.set,
-            yscrollcommand=self.scrolly.set)
+            xscrollcommand=self._xscrolled,
+            yscrollcommand=self._yscrolled)
+
+    def _xscrolled(self, lo, hi):
+        self.scrollx.set(lo, hi)
+        self.canv.bgim.schedule(self.canv)
+
+    def _yscrolled(self, lo, hi):
+        self.scrolly.set(lo, hi)
+        self.canv.bgim.schedule(self.canv)
 
 class DictMode(tk.Frame, object):
     def __init__(self, *args, **kwargs):
@@ -428,6 +471,9 @@ class InfoPanel(tk.Frame, object):
             row=0, column=self.frameinfo.grid_size()[0], sticky='nsew')
         self.frameinfo.grid_columnconfigure(
             self.frameinfo.grid_size()[0]-1, weight=1)
+        self.framepos = tk.Label(self.frameinfo)
+        self.framepos.grid(
+            row=0, column=self.frameinfo.grid_size()[0], sticky='nsew')
         self.zoomvar = tk.StringVar(self)
         self.zoomvar.set('100%')
         self.zoomlabel = tk.Label(self.frameinfo, text='zoom: ')
@@ -468,6 +514,37 @@ class InfoPanel(tk.Frame, object):
                 self.stepsize, self._validate_stepsize),
             invalidcommand=tku.ValSubs.make_script_(
                 self.stepsize, self._invalid_stepsize))
+        self.preview = tk.BooleanVar(self)
+        self.previewbutton = tk.Checkbutton(
+            self.stepframe, text='preview', variable=self.preview)
+        self.previewbutton.grid(row=0, column=self.stepframe.grid_size()[0])
+
+        self.windowframe = tk.Frame(self)
+        self.windowframe.grid(row=self.grid_size()[1], column=0, sticky='nsew')
+        self.windowlabel = tk.Label(
+            self.windowframe, text='high bit depth window:')
+        self.windowlabel.grid(row=0, column=0)
+        self.windowmode = tk.StringVar(self)
+        self.windowmode.set(Window.MODES[0])
+        self.windowmodes = [
+            tk.Radiobutton(
+                self.windowframe,
+                text=mode,
+                value=mode,
+                variable=self.windowmode)
+            for mode in Window.MODES]
+        for button in self.windowmodes:
+            button.grid(row=0, column=self.windowframe.grid_size()[0])
+        self.windowlo = tk.Entry(self.windowframe, width=10)
+        self.windowlo.grid(row=0, column=self.windowframe.grid_size()[0])
+        self.windowhi = tk.Entry(self.windowframe, width=10)
+        self.windowhi.grid(row=0, column=self.windowframe.grid_size()[0])
+
+    def setwindow(self, lo, hi):
+        """Show window bounds."""
+        for entry, val in ((self.windowlo, lo), (self.windowhi, hi)):
+            entry.delete(0, 'end')
+            entry.insert(0, '{:g}'.format(val))
 
     @staticmethod
     def _validate_stepsize(widget, pending, valtype):
@@ -488,6 +565,10 @@ class InfoPanel(tk.Frame, object):
         widget.bell()
 
 class Labeler(tk.Tk, object):
+    # playback rate if the imset has no fps
+    PLAYFPS = 10
+    # ms on a preview before loading full resolution
+    SETTLE = 300
     def __init__(self, *args, **kwargs):
         super(Labeler, self).__init__(*args, **kwargs)
         self.changed = False
@@ -515,25 +596,50 @@ class Labeler(tk.Tk, object):
         self._showq = queue.Queue()
         self._showname = str(id(self._show.__func__))+'_show'
         self.createcommand(self._showname, self._show)
+        self._posname = str(id(self._update_pos.__func__))+'_pos'
+        self.createcommand(self._posname, self._update_pos)
+        # percent of the imset indexed, None if unknown
+        self._indexed = None
+        self._swapq = queue.Queue()
+        self._swapname = str(id(self._swap.__func__))+'_swap'
+        self.createcommand(self._swapname, self._swap)
+        # (h, w) of last full resolution frame
+        self._fullsize = None
+        self._refineid = None
+        # [offset, seconds per frame, due time, after id]
+        self._play = None
+        self.gridview = None
+        self.frameinfo.windowmode.trace('w', self._rewindow)
+        for entry in (self.frameinfo.windowlo, self.frameinfo.windowhi):
+            entry.bind('<Return>', self._manualwindow)
 
         self.lcanv.focus_set()
 
-    def _show_callback(self, imname, frame):
-        self._showq.put((imname, frame))
+    def _show_callback(self, imname, frame, reduce=1):
+        if frame is not None:
+            frame = BgIm.prepare(frame)
+        self._showq.put((imname, frame, reduce))
         self.tk.call('after', 'idle', self._showname)
 
     def _show(self):
         try:
-            name, im = self._showq.get()
+            name, im, reduce = self._showq.get()
         except Exception:
             return
+        self._continue_play()
         if im is None:
             messagebox.showerror(
                 title='Error',
                 message='Failed to load image {}.'.format(name))
             return
         self.frameinfo.framename.configure(text=name)
-        self.lcanv.show(im)
+        self._update_pos()
+        self.lcanv.show(im, reduce, prepared=True)
+        self.frameinfo.setwindow(*self.lcanv.bgim.window.bounds)
+        if reduce == 1:
+            self._fullsize = im.shape[:2]
+        else:
+            self._refineid = self.after(self.SETTLE, self._refine, name)
         labels = self.labels.get(name, None)
         if labels is None:
             mode = self.frameinfo.transitionmode.get()
@@ -553,7 +659,78 @@ class Labeler(tk.Tk, object):
     def show(self, k=None, offset=0):
         self.lcanv.unselect()
         self._update_labels()
-        self.imset(k, offset, self._show_callback)
+        if self._refineid is not None:
+            self.after_cancel(self._refineid)
+            self._refineid = None
+        reduce = self._reduction()
+        if reduce == 1:
+            self.imset(k, offset, self._show_callback)
+        else:
+            self.imset(k, offset, self._show_callback, reduce)
+
+    def _reduction(self):
+        """Return the preview reduction to use.
+
+        Use the largest of 1, 2, 4, or 8 such that the preview still
+        covers the canvas (assuming the same size as the last full
+        resolution frame).
+        """
+        if not (
+                self.frameinfo.preview.get() and self.imset.PREVIEW
+                and self._fullsize and self.lcanv.zoomfactor == 2):
+            return 1
+        h, w = self._fullsize
+        cw = self.lcanv.winfo_width()
+        ch = self.lcanv.winfo_height()
+        reduce = 1
+        while reduce < 8 and w >= cw*reduce*2 and h >= ch*reduce*2:
+            reduce *= 2
+        return reduce
+
+    def _refine(self, name):
+        """Load full resolution after settling on a preview."""
+        self._refineid = None
+        self.imset(name, 0, self._swap_callback)
+
+    def _swap_callback(self, imname, frame):
+        if frame is not None:
+            frame = BgIm.prepare(frame)
+        self._swapq.put((imname, frame))
+        self.tk.call('after', 'idle', self._swapname)
+
+    def _rewindow(self, *args):
+        """Apply the window mode (and manual bounds)."""
+        info = self.frameinfo
+        mode = info.windowmode.get()
+        lo = hi = None
+        if mode == 'manual':
+            try:
+                lo = float(info.windowlo.get())
+                hi = float(info.windowhi.get())
+            except ValueError:
+                self.bell()
+                return
+        bgim = self.lcanv.bgim
+        bgim.rewindow(self.lcanv, mode, lo, hi)
+        info.setwindow(*bgim.window.bounds)
+
+    def _manualwindow(self, event):
+        """Switch to manual window from the bound entries."""
+        if self.frameinfo.windowmode.get() == 'manual':
+            self._rewindow()
+        else:
+            self.frameinfo.windowmode.set('manual')
+
+    def _swap(self):
+        """Swap full resolution frame in for its preview."""
+        try:
+            name, im = self._swapq.get()
+        except Exception:
+            return
+        if im is not None and name == self.frameinfo.framename.cget('text'):
+            self.lcanv.bgim.swap(self.lcanv, im, prepared=True)
+            self._fullsize = im.shape[:2]
+            self.frameinfo.setwindow(*self.lcanv.bgim.window.bounds)
 
 #        try:
 #            name, im = self.imset(k)
@@ -583,13 +760,98 @@ class Labeler(tk.Tk, object):
 #            self.lcanv.restore(labels)
 
 
+    def toggle_play(self, offset):
+        """Start/stop showing frames continuously.
+
+        offset: the offset to step by for each frame.
+        Frames are requested at the imset's fps (or PLAYFPS) but a new
+        frame is only requested after the previous one was shown.
+        """
+        if self._play is not None:
+            self.stop_play()
+        elif self.imset is not None:
+            fps = self.imset.fps or self.PLAYFPS
+            self._play = [offset, 1.0 / fps, 0, None]
+            self._playnext()
+
+    def stop_play(self):
+        play = self._play
+        if play is not None:
+            if play[3] is not None:
+                self.after_cancel(play[3])
+            self._play = None
+
+    def _playnext(self):
+        play = self._play
+        play[2] = time.time() + play[1]
+        play[3] = None
+        index = self.imset.index
+        self.show(None, play[0])
+        if self.imset.index == index:
+            self.stop_play()
+
+    def _continue_play(self):
+        """Schedule the next frame of playback if playing."""
+        play = self._play
+        if play is not None and play[3] is None:
+            delay = max(0, int((play[2] - time.time()) * 1000))
+            play[3] = self.after(delay, self._playnext)
+
+    def _update_pos(self):
+        """Update displayed position in the imset."""
+        imset = self.imset
+        if imset is not None:
+            text = '({}/{})'.format(imset.index+1, len(imset))
+            if imset.badframes is not None:
+                text = '{} bad: {}'.format(text, imset.badframes.sum())
+            if imset.skipped:
+                text = '{} skipped: {}'.format(text, len(imset.skipped))
+            if not imset.complete():
+                if self._indexed is None:
+                    text = '{} listing...'.format(text)
+                else:
+                    text = '{} indexing: {}%'.format(text, self._indexed)
+            self.frameinfo.framepos.configure(text=text)
+            if self.gridview is not None:
+                self.gridview.canv.setcurrent(imset.index)
+
+    def _imset_changed(self, imset):
+        """Callback for watched imset changes (from another thread)."""
+        self.tk.call('after', 'idle', self._posname)
+
+    def _progress(self, done, total):
+        """Progress callback for imset indexing (from another thread)."""
+        pct = 100 * done // max(total, 1)
+        if pct != self._indexed:
+            self._indexed = pct
+            self.tk.call('after', 'idle', self._posname)
+
+    def set_imset(self, imset):
+        """Change to a new imset.
+
+        Watch it for changes and sniff out non-images if possible.
+        """
+        self.stop_play()
+        old = self.imset
+        if old is not None and hasattr(old, 'unwatch'):
+            old.unwatch()
+        self.imset = imset
+        if hasattr(imset, 'watch'):
+            imset.watch(self._imset_changed)
+        if hasattr(imset, 'sniff'):
+            imset.sniff(self._imset_changed)
+        imset.loadbad()
+        self.frameinfo.frameset.configure(text=imset.path)
+        if self.gridview is not None:
+            self.gridview.set_imset(imset)
+
     def change_imset(self, offset):
         self.lcanv.syncinfo()
         if self._canceled_save():
             return
         self.labels = {}
-        self.imset = self.imset.next(offset)
-        self.frameinfo.frameset.configure(text=self.imset.path)
+        self._indexed = None
+        self.set_imset(self.imset.next(offset, self._progress))
         self.show()
 
     @tku.Bindings('<Control-o>', '<Control-O>')
@@ -606,8 +868,8 @@ class Labeler(tk.Tk, object):
         if fnames:
             if len(fnames) == 1:
                 fnames = fnames[0]
-            self.imset = ImageSet.open(fnames)
-            self.frameinfo.frameset.configure(text=self.imset.path)
+            self._indexed = None
+            self.set_imset(ImageSet.open(fnames, self._progress))
             self.show()
 
     @tku.Bindings('<Control-Shift-o>', '<Control-Shift-O>')
@@ -619,8 +881,8 @@ class Labeler(tk.Tk, object):
             title='Open Image Directory.',
             mustexist=True, **kwargs)
         if dname:
-            self.imset = ImageSet.open(dname)
-            self.frameinfo.frameset.configure(text=self.imset.path)
+            self._indexed = None
+            self.set_imset(ImageSet.open(dname, self._progress))
             self.show()
 
     @staticmethod
@@ -699,6 +961,8 @@ class Labeler(tk.Tk, object):
                 messagebox.showerror('Unknown file type "{}"'.format(ext))
                 return
             self.labels = data['labels']
+            if self.gridview is not None:
+                self.gridview.canv.relabel(self.labels)
             restore_composites(data['composites'])
             self.sidepanel.selector.resync()
             curframe = self.frameinfo.framename.cget('text')
@@ -710,6 +974,20 @@ class Labeler(tk.Tk, object):
             self.changed = False
             self._labelname = fname
 
+    @tku.Bindings('<Control-k>', '<Control-K>')
+    def _validate(self):
+        """Check for bad frames in the background."""
+        if self.imset is not None:
+            self.imset.validate(self._imset_changed)
+
+    @tku.Bindings('<Control-g>', '<Control-G>')
+    def open_grid(self):
+        """Open a thumbnail grid of the imset."""
+        if self.gridview is not None:
+            self.gridview.lift()
+        elif self.imset is not None:
+            self.gridview = GridView(self)
+
     @tku.Bindings('<Control-r>', '<Control-R>')
     def _resync(self):
         if self.imset is not None:
@@ -727,6 +1005,8 @@ class Labeler(tk.Tk, object):
                 self.labels.pop(oldname, None)
             self.changed = bool(oldname) or self.changed
             self.lcanv.changed = False
+            if self.gridview is not None and oldname:
+                self.gridview.canv.relabel(self.labels, oldname)
 
     def _canceled_save(self):
         """True if canceled, else False."""
@@ -0,0 +1,66 @@
+"""Resampling regions of frames for display at a zoom scale.
+
+Enlargements use INTER_NEAREST so pixels stay sharp for precise
+labeling.  Reductions use INTER_AREA (box averaging) except within an
+octave of non-integer factors, where INTER_AREA is several times slower
+than INTER_LINEAR for little difference (see bench.py resample).
+Integer enlargements and reductions by an integer factor (which covers
+the power of two zoom levels) sample whole source pixels so adjacent
+regions line up exactly.
+"""
+from __future__ import division
+__all__ = ['interpolation', 'resample']
+
+import cv2
+import numpy as np
+
+def interpolation(scale):
+    """Return the cv2 interpolation used for scale."""
+    if scale >= 1:
+        return cv2.INTER_NEAREST
+    if scale < 0.5 or _intfactor(1 / scale) is not None:
+        return cv2.INTER_AREA
+    return cv2.INTER_LINEAR
+
+def _intfactor(val):
+    """Return val as an int if it is (nearly) one, else None."""
+    k = int(round(val))
+    if k >= 1 and abs(k - val) < 1e-9:
+        return k
+    return None
+
+def resample(src, x, y, w, h, scale):
+    """Return the w x h region at x, y of src displayed at scale.
+
+    x, y, w, h are in display pixels.  Regions past the edge of src
+    are clamped to it.
+    """
+    if scale == 1:
+        return src[y:y+h, x:x+w]
+    sh, sw = src.shape[:2]
+    if scale > 1:
+        k = _intfactor(scale)
+        if k is not None:
+            sub = src[y//k:-(-(y+h)//k), x//k:-(-(x+w)//k)]
+            big = cv2.resize(
+                sub, None, fx=k, fy=k, interpolation=cv2.INTER_NEAREST)
+            return big[y % k:y % k + h, x % k:x % k + w]
+        # nearest source pixel centers, relative to the covered region
+        xs = ((np.arange(x, x+w) + 0.5) / scale).astype(int)
+        ys = ((np.arange(y, y+h) + 0.5) / scale).astype(int)
+        np.minimum(xs, sw-1, out=xs)
+        np.minimum(ys, sh-1, out=ys)
+        sub = src[ys[0]:ys[-1]+1, xs[0]:xs[-1]+1]
+        mapx = np.empty((h, w), np.float32)
+        mapy = np.empty((h, w), np.float32)
+        mapx[...] = xs - xs[0]
+        mapy[...] = (ys - ys[0])[:, None]
+        return cv2.remap(sub, mapx, mapy, cv2.INTER_NEAREST)
+    k = _intfactor(1 / scale)
+    if k is not None:
+        sub = src[y*k:(y+h)*k, x*k:(x+w)*k]
+    else:
+        sub = src[
+            int(y/scale):min(int(np.ceil((y+h)/scale)), sh),
+            int(x/scale):min(int(np.ceil((x+w)/scale)), sw)]
+    return cv2.resize(sub, (w, h), interpolation=interpolation(scale))
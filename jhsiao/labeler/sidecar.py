@@ -0,0 +1,121 @@
+"""Persistent per-source data (indices, manifests, etc).
+
+Sidecars are stored in a cache directory rather than next to the
+source so datasets are never written to.  The directory is
+$JHSIAO_LABELER_CACHE if set, else ~/.cache/jhsiao-labeler.  Sidecar
+names are derived from a hash of the absolute path of the source.
+
+Each json sidecar records the stamp of its source (mtime and size)
+and load() ignores it if the source has since changed.  Large numeric
+data can be stored as .npy with savearray() and memory-mapped back
+with loadarray().
+"""
+from __future__ import print_function, division
+__all__ = [
+    'cachedir', 'path', 'stamp', 'load', 'save', 'loadarray', 'savearray']
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+if sys.version_info.major > 2:
+    replace = os.replace
+else:
+    def replace(src, dst):
+        """Rename src to dst, overwriting dst."""
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+def cachedir():
+    """Return the sidecar directory, creating it if needed."""
+    dname = os.environ.get('JHSIAO_LABELER_CACHE')
+    if not dname:
+        dname = os.path.join(
+            os.path.expanduser('~'), '.cache', 'jhsiao-labeler')
+    if not os.path.isdir(dname):
+        try:
+            os.makedirs(dname)
+        except OSError:
+            if not os.path.isdir(dname):
+                raise
+    return dname
+
+def path(src, ext):
+    """Return the sidecar path for src with extension ext."""
+    name = os.path.abspath(src)
+    if not isinstance(name, bytes):
+        name = name.encode('utf-8', 'surrogateescape')
+    return os.path.join(
+        cachedir(), '{}.{}'.format(hashlib.sha1(name).hexdigest(), ext))
+
+def stamp(src):
+    """Return [mtime, size] of src."""
+    st = os.stat(src)
+    return [st.st_mtime, st.st_size]
+
+def load(src, ext):
+    """Load json sidecar data for src.
+
+    Return None if missing, unreadable, or src changed since save().
+    """
+    try:
+        with open(path(src, ext), 'r') as f:
+            data = json.load(f)
+        if data['stamp'] == stamp(src):
+            return data['data']
+    except Exception:
+        pass
+    return None
+
+def save(src, ext, data, srcstamp=None):
+    """Save json-compatible data as sidecar for src.
+
+    srcstamp: stamp(src) taken before data was computed.  Use this if
+        src might change while computing data.  Default to current.
+    Failure to save is reported but not raised since sidecars are only
+    an optimization.
+    """
+    try:
+        if srcstamp is None:
+            srcstamp = stamp(src)
+        fname = path(src, ext)
+        tmpname = '{}.{}.tmp'.format(fname, os.getpid())
+        with open(tmpname, 'w') as f:
+            json.dump(dict(stamp=srcstamp, data=data), f)
+        replace(tmpname, fname)
+    except Exception as e:
+        print('failed to save sidecar for', src, e, file=sys.stderr)
+
+def loadarray(src, ext):
+    """Load array sidecar for src as a read-only memmap.
+
+    Return None if missing, unreadable, or src changed since
+    savearray().
+    """
+    if load(src, ext) is None:
+        return None
+    try:
+        return np.load(path(src, ext + '.npy'), mmap_mode='r')
+    except Exception:
+        return None
+
+def savearray(src, ext, arr, srcstamp=None):
+    """Save a numpy array as sidecar for src.
+
+    The array is saved as .npy and its stamp as a json sidecar, which
+    is written last so a partial save is never loaded.
+    """
+    try:
+        if srcstamp is None:
+            srcstamp = stamp(src)
+        fname = path(src, ext + '.npy')
+        tmpname = '{}.{}.tmp'.format(fname, os.getpid())
+        with open(tmpname, 'wb') as f:
+            np.save(f, arr)
+        replace(tmpname, fname)
+    except Exception as e:
+        print('failed to save sidecar for', src, e, file=sys.stderr)
+        return
+    save(src, ext, dict(dtype=arr.dtype.str, shape=arr.shape), srcstamp)
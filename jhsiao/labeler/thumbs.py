@@ -0,0 +1,196 @@
+"""Persistent thumbnails of image set frames.
+
+Thumbnails of a set are small jpegs appended to a single packed file
+in the sidecar directory.  An index maps '<name>:<mtime>' keys to
+(offset, size, scale) in the packed file so a changed frame gets a new
+thumbnail.  scale is the thumbnail width over the frame width (for
+drawing labels over it).  Missing thumbnails are made by THUMBNAIL priority jobs
+on the shared ImageSet loop, using reduced decoding when possible.
+"""
+from __future__ import print_function, division
+__all__ = ['ThumbStore']
+import json
+import os
+import sys
+import threading
+
+import cv2
+import numpy as np
+
+from . import sidecar
+from .imset import ImageSet, Loop, decode
+
+class ThumbStore(object):
+    """Thumbnails of the frames of an ImageSet.
+
+    The index is saved every FLUSH new thumbnails and on flush().
+    Stale entries are not removed from the packed file.  Frames are
+    decoded at the largest reduction (up to 8) that still gives at
+    least size, judged from the previous frame.
+    """
+    SIZE = 128
+    QUALITY = 85
+    FLUSH = 64
+    def __init__(self, imset, size=None):
+        """Initialize a ThumbStore.
+
+        size: max thumbnail width and height.
+        """
+        self.imset = imset
+        self.size = size or self.SIZE
+        self.loop = ImageSet.LOOP()
+        self.lock = threading.Lock()
+        ext = 'thumbs{}'.format(self.size)
+        self.packname = sidecar.path(imset.path, ext)
+        self.indexname = sidecar.path(imset.path, ext + 'idx')
+        self.pack = open(self.packname, 'a+b')
+        self.pack.seek(0, 2)
+        packsize = self.pack.tell()
+        try:
+            with open(self.indexname, 'r') as f:
+                self.index = json.load(f)
+        except Exception:
+            self.index = {}
+        if any(
+                len(entry) != 3 or entry[0] + entry[1] > packsize
+                for entry in self.index.values()):
+            self.index = {}
+        self.unsaved = 0
+        self.reduce = 8 if imset.PREVIEW else 1
+
+    def key(self, idx):
+        """Return (name, index key) of frame idx."""
+        name = self.imset[idx][1]
+        try:
+            mtime = self.imset.frametime(idx)
+        except EnvironmentError:
+            mtime = None
+        return name, '{}:{}'.format(name, mtime)
+
+    def get(self, idx):
+        """Return stored (name, thumbnail, scale) or (name, None, None)."""
+        name, key = self.key(idx)
+        return (name,) + self._get(key)
+
+    def _get(self, key):
+        """Return (thumbnail, scale) for key or (None, None)."""
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None or self.pack.closed:
+                return None, None
+            offset, size, scale = entry
+            self.pack.seek(offset)
+            buf = self.pack.read(size)
+        return decode(buf), scale
+
+    def request(self, idx, callback):
+        """Return (thumbnail, scale) of frame idx if stored.
+
+        Otherwise, return (None, None) and make it in the background.
+        callback(idx, name, thumbnail, scale) is called (from a loop
+        thread) when done.  thumbnail is None if the frame failed to
+        decode.
+        """
+        name, key = self.key(idx)
+        ret = self._get(key)
+        if ret[0] is None:
+            self.loop.put(self._make, (idx, key, callback), Loop.THUMBNAIL)
+        return ret
+
+    def cancel(self):
+        """Cancel pending requests."""
+        self.loop.cancel(Loop.THUMBNAIL)
+
+    def _make(self, info):
+        idx, key, callback = info
+        with self.lock:
+            exists = key in self.index
+        if exists:
+            thumb, scale = self._get(key)
+            name = self.imset[idx][1]
+        else:
+            name, thumb, scale = self.shrink(idx)
+            if thumb is not None:
+                self._put(key, thumb, scale)
+        self.loop.deliver(callback, idx, name, thumb, scale)
+
+    def shrink(self, idx):
+        """Decode frame idx and return (name, thumbnail, scale).
+
+        thumbnail and scale are None if decoding failed.
+        """
+        imset = self.imset
+        frame = None
+        reduce = self.reduce
+        if reduce > 1:
+            name, frame = imset._read(idx, reduce)
+            if frame is not None:
+                full = max(frame.shape[:2]) * reduce
+                while reduce > 1 and full < self.size * reduce:
+                    reduce //= 2
+                if reduce != self.reduce:
+                    self.reduce = reduce
+                    frame = None
+                    if reduce > 1:
+                        name, frame = imset._read(idx, reduce)
+        if frame is None:
+            reduce = 1
+            name, frame = imset._read(idx)
+        if frame is None:
+            return name, None, None
+        if frame.dtype != np.uint8:
+            frame = cv2.normalize(
+                frame, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+        if frame.ndim == 3 and frame.shape[2] == 4:
+            frame = frame[..., :3]
+        h, w = frame.shape[:2]
+        scale = self.size / max(h, w)
+        if scale < 1:
+            frame = cv2.resize(
+                frame, (max(int(w*scale), 1), max(int(h*scale), 1)),
+                interpolation=cv2.INTER_AREA)
+        return name, frame, frame.shape[1] / (w*reduce)
+
+    def _put(self, key, thumb, scale):
+        """Append encoded thumb to the pack."""
+        success, buf = cv2.imencode(
+            '.jpg', thumb, [cv2.IMWRITE_JPEG_QUALITY, self.QUALITY])
+        if not success:
+            return
+        data = buf.tobytes()
+        with self.lock:
+            if self.pack.closed:
+                return
+            self.pack.seek(0, 2)
+            offset = self.pack.tell()
+            self.pack.write(data)
+            self.index[key] = (offset, len(data), scale)
+            self.unsaved += 1
+            if self.unsaved >= self.FLUSH:
+                self._flush()
+
+    def flush(self):
+        """Save the index."""
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        """Save the index, assume lock is held."""
+        if not self.unsaved:
+            return
+        self.pack.flush()
+        tmpname = '{}.{}.tmp'.format(self.indexname, os.getpid())
+        try:
+            with open(tmpname, 'w') as f:
+                json.dump(self.index, f)
+            sidecar.replace(tmpname, self.indexname)
+        except Exception as e:
+            print('failed to save thumbnail index', e, file=sys.stderr)
+        self.unsaved = 0
+
+    def close(self):
+        """Cancel requests, save the index, and close the pack."""
+        self.cancel()
+        with self.lock:
+            self._flush()
+            self.pack.close()
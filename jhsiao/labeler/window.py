@@ -0,0 +1,91 @@
+"""Window/level mapping of high bit depth frames to uint8 for display."""
+from __future__ import division
+__all__ = ['Window']
+import math
+
+import numpy as np
+
+class Window(object):
+    """Map uint16 or float frames to uint8.
+
+    Values in [lo, hi] are mapped linearly to [0, 255] and clipped.
+    lo and hi come from the frame (minmax or percentile) or are set
+    manually.  uint16 frames are mapped with a 65536 entry lookup
+    table that is only rebuilt when the bounds change.  Bounds are
+    computed from at most SAMPLES evenly strided pixels.
+    """
+    MODES = ('minmax', 'percentile', 'manual')
+    # percent clipped at each end in percentile mode
+    PERCENT = 0.5
+    SAMPLES = 2**20
+    def __init__(self, mode='minmax'):
+        self.mode = mode
+        self.bounds = (0, 65535)
+        self._lut = None
+        self._lutbounds = None
+
+    def _sample(self, arr):
+        step = int(math.ceil(math.sqrt(arr.size / self.SAMPLES)))
+        if step > 1:
+            arr = arr[::step, ::step]
+        return arr
+
+    def fit(self, arr):
+        """Update bounds from arr unless in manual mode."""
+        if self.mode == 'manual':
+            return
+        sample = self._sample(arr)
+        if sample.dtype == np.uint16:
+            counts = np.bincount(sample.ravel(), minlength=65536)
+            cum = np.cumsum(counts)
+            if self.mode == 'percentile':
+                clip = cum[-1] * self.PERCENT / 100
+            else:
+                clip = 0
+            lo = int(np.searchsorted(cum, clip, side='right'))
+            hi = int(np.searchsorted(cum, cum[-1] - clip, side='left'))
+        else:
+            sample = sample[np.isfinite(sample)]
+            if not sample.size:
+                return
+            if self.mode == 'percentile':
+                lo, hi = np.percentile(
+                    sample, (self.PERCENT, 100 - self.PERCENT))
+            else:
+                lo, hi = sample.min(), sample.max()
+            lo, hi = float(lo), float(hi)
+        self.bounds = (lo, hi)
+
+    def set(self, mode, lo=None, hi=None):
+        """Change mode and manual bounds.
+
+        Return True if bounds changed.  Auto modes need fit() again.
+        """
+        self.mode = mode
+        if mode == 'manual' and lo is not None and hi is not None:
+            old = self.bounds
+            self.bounds = (lo, hi)
+            return old != self.bounds
+        return False
+
+    def lut(self):
+        """Return uint8 lookup table for uint16 values."""
+        if self._lutbounds != self.bounds:
+            lo, hi = self.bounds
+            scale = 255 / max(hi - lo, 1e-12)
+            vals = (np.arange(65536, dtype=np.float32) - lo) * scale
+            self._lut = np.clip(vals, 0, 255).astype(np.uint8)
+            self._lutbounds = self.bounds
+        return self._lut
+
+    def apply(self, arr):
+        """Return arr mapped to uint8."""
+        if arr.dtype == np.uint8:
+            return arr
+        if arr.dtype == np.uint16:
+            return self.lut()[arr]
+        lo, hi = self.bounds
+        scale = 255 / max(hi - lo, 1e-12)
+        out = (arr - np.float32(lo)) * np.float32(scale)
+        np.clip(out, 0, 255, out=out)
+        return out.astype(np.uint8)
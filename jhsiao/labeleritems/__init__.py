@@ -339,6 +339,25 @@ class Item(tku.Behavior):
         """
         return [d1 + interp*(d2-d1) for d1,d2 in zip(data1, data2)]
 
+    @classmethod
+    def outline(cls, data):
+        """Return outline of todict()['data'] for drawing labels small.
+
+        Return a list of flat [x1, y1, x2, y2, ...] polygons in image
+        coordinates.  A polygon with 1 point is drawn as a dot.
+        """
+        return []
+
+    @staticmethod
+    def outlinedict(dct):
+        """Return (color, outline) of return value of todict."""
+        try:
+            cls = itemclasses[dct['type']]
+        except KeyError:
+            itemclasses.update(get_items())
+            cls = itemclasses[dct['type']]
+        return dct['color'], cls.outline(dct['data'])
+
     def todict(self, widget):
         """Return self as a dict."""
         return dict(
@@ -554,6 +573,14 @@ class Composite(Item):
         d['data'] = data
         return d
 
+    @classmethod
+    def outline(cls, data):
+        it = iter(data)
+        result = []
+        for sub in cls.components:
+            result.extend(sub.outline(list(islice(it, sub.LENGTH))))
+        return result
+
     @classmethod
     def interpolate(cls, data1, data2, interp):
         it1 = iter(data1)
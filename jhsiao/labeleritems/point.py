@@ -118,6 +118,10 @@ class Point(Item):
         """Release to place the point."""
         cls.unselect(widget, 'current')
 
+    @classmethod
+    def outline(cls, data):
+        return [list(data)]
+
     def todict(self, widget):
         """Return dict.
 
@@ -91,6 +91,11 @@ class Rectangle(Item):
         widget.crosshairs.show(widget, x, y)
         Rectangle.unselect(widget, widget.find('withtag', 'current')[0])
 
+    @classmethod
+    def outline(cls, data):
+        l, t, r, b = data
+        return [[l, t, r, t, r, b, l, b]]
+
     def todict(self, widget):
         d = super(Rectangle, self).todict(widget)
         d['data'] = widget.coords(self.idns[0])
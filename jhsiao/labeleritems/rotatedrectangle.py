@@ -138,6 +138,18 @@ class RotatedRectangle(Item, tku.Behavior):
         ret['data'] = (cx, cy, w, h, a, offset)
         return ret
 
+    @classmethod
+    def outline(cls, data):
+        cx, cy, w, h, a, offset = data
+        s = math.sin(a)/2
+        c = math.cos(a)/2
+        vx, vy = s*h, c*h
+        tx, ty = cx+vx, cy-vy
+        bx, by = cx-vx, cy+vy
+        hx, hy = c*w, s*w
+        return [[
+            tx+hx, ty+hy, tx-hx, ty-hy, bx-hx, by-hy, bx+hx, by+hy]]
+
     @classmethod
     def fromdict(cls, widget, dct, owned=False):
         cx, cy, w, h, a, offset = dct['data']